@@ -0,0 +1,88 @@
+"""
+Cross-worker invalidation of the in-process user and subscription caches.
+
+Triggers on the cached tables (see models.auth_cache_trigger_sql) NOTIFY AUTH_CACHE_CHANNEL
+with a user's id whenever a cached field of that user changes. Each API worker LISTENs on a
+dedicated connection and runs the registered handlers, so a role change or a payment is seen
+by every worker on its next request instead of when the cache entries expire.
+"""
+import logging
+import select
+import threading
+from typing import Callable
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from . import config
+from .models import AUTH_CACHE_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+# Seconds between reconnect attempts after the listening connection is lost
+RECONNECT_DELAY_SECONDS = 5
+
+# Called with the id of the changed user, or None to drop every cached entry
+_handlers: list[Callable[[int | None], None]] = []
+
+# Bumped on every invalidation. Loaders read it before querying the database and only cache
+# their result if it is unchanged, so a row read just before a change is never cached after it.
+_generation = 0
+_generation_lock = threading.Lock()
+
+_stop = threading.Event()
+_listener: threading.Thread | None = None
+
+def on_invalidate(handler: Callable[[int | None], None]):
+    """Registers a cache eviction handler; usable as a decorator."""
+    _handlers.append(handler)
+    return handler
+
+def generation() -> int:
+    return _generation
+
+def invalidate(user_id: int | None):
+    """Evicts a user (or everyone, for None) from the caches of this process."""
+    global _generation
+    with _generation_lock:
+        _generation += 1
+    for handler in _handlers:
+        handler(user_id)
+
+def _listen():
+    while not _stop.is_set():
+        conn = None
+        try:
+            conn = psycopg2.connect(config.settings.DB_LISTEN_URL or config.settings.DATABASE_URL)
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {AUTH_CACHE_CHANNEL}")
+            # Changes made while no connection was listening were missed
+            invalidate(None)
+            while not _stop.is_set():
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    payload = conn.notifies.pop(0).payload
+                    invalidate(int(payload) if payload.isdigit() else None)
+        except Exception as e:
+            logger.warning(f"Auth cache listener disconnected: {e}. Reconnecting in {RECONNECT_DELAY_SECONDS}s.")
+            _stop.wait(RECONNECT_DELAY_SECONDS)
+        finally:
+            if conn is not None:
+                conn.close()
+
+def start_listener():
+    """Starts the background LISTEN thread of this worker."""
+    global _listener
+    if _listener is not None and _listener.is_alive():
+        return
+    _stop.clear()
+    _listener = threading.Thread(target=_listen, name="auth-cache-listener", daemon=True)
+    _listener.start()
+
+def stop_listener():
+    _stop.set()
+    if _listener is not None:
+        _listener.join(timeout=RECONNECT_DELAY_SECONDS)
@@ -27,12 +27,45 @@ class Settings:
     DB_HOST: str = os.getenv("DB_HOST", "localhost")
     DB_PORT: str = os.getenv("DB_PORT", "5432")
     DB_NAME: str = os.getenv("DB_NAME", "mock_test_db")
+
+    # --- Connection Pool Settings ---
+    # The sync and async engines each keep a pool; per worker they open up to
+    # DB_POOL_SIZE + DB_MAX_OVERFLOW + ASYNC_DB_POOL_SIZE + ASYNC_DB_MAX_OVERFLOW connections
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+    ASYNC_DB_POOL_SIZE: int = int(os.getenv("ASYNC_DB_POOL_SIZE", "10"))
+    ASYNC_DB_MAX_OVERFLOW: int = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "5"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800")) # Seconds before a connection is replaced
+    # Set to "1" when connecting through PgBouncer in transaction mode; PgBouncer does the pooling
+    DB_USE_PGBOUNCER: bool = os.getenv("DB_USE_PGBOUNCER", "0") == "1"
+    # Direct Postgres URL for the auth cache LISTEN connection, which PgBouncer's transaction
+    # pooling can't hold open. Defaults to DATABASE_URL.
+    DB_LISTEN_URL: str | None = os.getenv("DB_LISTEN_URL")
     
+    # Set to "1" in local development to create missing tables when the API starts
+    AUTO_MIGRATE: bool = os.getenv("AUTO_MIGRATE", "0") == "1"
+
+    # --- CORS Settings ---
+    # Comma-separated list of frontend origins allowed to call the API
+    CORS_ORIGINS: list[str] = [
+        origin.strip() for origin in os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",") if origin.strip()
+    ]
+
+    # --- Redis Settings ---
+    # Used to share exam generation task status between API workers, e.g. redis://localhost:6379/0
+    REDIS_URL: str | None = os.getenv("REDIS_URL")
+
     @property
     def DATABASE_URL(self) -> str:
         """Constructs the full database URL from individual components."""
         return f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        """The same database, through the asyncpg driver used by the async endpoints."""
+        return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+
 # Create a single settings instance to be used throughout the application
 settings = Settings()
 
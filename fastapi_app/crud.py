@@ -1,15 +1,113 @@
-from sqlalchemy.orm import Session
-from . import models, schema, security
+from sqlalchemy import select, insert, update, bindparam, func, exists, tuple_
+from sqlalchemy.orm import Session, joinedload, defer
+from sqlalchemy.ext.asyncio import AsyncSession
+from cachetools import TTLCache
+from dataclasses import dataclass
+from . import cache_invalidation, models, schema, security
 import datetime
+import threading
 from typing import List
 
 # --- User CRUD Functions ---
 
-def get_user_by_email(db: Session, email: str):
+# Built once at import so the login/register hot path reuses the same statement
+# object (and therefore SQLAlchemy's compiled-SQL cache entry) on every call.
+# The subscription is joined in to prime the subscription cache below.
+_USER_BY_EMAIL_STMT = (
+    select(models.User)
+    .options(joinedload(models.User.subscription))
+    .where(models.User.email == bindparam("email"))
+)
+_USER_EXISTS_STMT = select(exists().where(models.User.email == bindparam("email")))
+
+@dataclass(frozen=True)
+class CachedSubscription:
+    """A detached, read-only snapshot of a user's subscription state."""
+    is_active: bool
+    expires_at: datetime.datetime | None
+    payment_customer_id: str | None
+
+@dataclass(frozen=True)
+class CachedUser:
+    """
+    A detached, read-only snapshot of the user fields needed for authentication.
+    Safe to share between requests because it is not bound to any Session.
+    """
+    id: int
+    email: str
+    full_name: str | None
+    hashed_password: str
+    role: models.UserRole
+    is_active: bool
+
+# Short-lived cache of email -> CachedUser. Sync endpoints run in FastAPI's
+# threadpool, so access is guarded by a lock (TTLCache is not thread-safe).
+# Entries are evicted on every worker when the user row changes (see cache_invalidation).
+_user_cache: TTLCache = TTLCache(maxsize=10_000, ttl=30)
+_user_cache_lock = threading.Lock()
+
+@cache_invalidation.on_invalidate
+def _evict_user(user_id: int | None):
+    with _user_cache_lock:
+        if user_id is None:
+            _user_cache.clear()
+            return
+        for email in [email for email, cached in _user_cache.items() if cached.id == user_id]:
+            _user_cache.pop(email, None)
+
+def _cached_user(email: str) -> CachedUser | None:
+    with _user_cache_lock:
+        return _user_cache.get(email)
+
+def _cache_user(db_user: models.User, generation: int) -> CachedUser:
+    """
+    Snapshots a loaded user row (and its joined subscription) into the caches, unless an
+    invalidation arrived since `generation` was read, i.e. while the row was being loaded.
+    """
+    cached = CachedUser(
+        id=db_user.id,
+        email=db_user.email,
+        full_name=db_user.full_name,
+        hashed_password=db_user.hashed_password,
+        role=db_user.role,
+        is_active=db_user.is_active,
+    )
+    if cache_invalidation.generation() == generation:
+        with _user_cache_lock:
+            _user_cache[db_user.email] = cached
+    _cache_subscription(db_user.id, db_user.subscription, generation)
+    return cached
+
+def get_user_by_email(db: Session, email: str) -> CachedUser | None:
     """
     Retrieves a single user from the database based on their email address.
+    Results are cached for a short time to keep the auth path off the database.
     """
-    return db.query(models.User).filter(models.User.email == email).first()
+    cached = _cached_user(email)
+    if cached is not None:
+        return cached
+
+    generation = cache_invalidation.generation()
+    db_user = db.execute(_USER_BY_EMAIL_STMT, {"email": email}).scalar_one_or_none()
+    return _cache_user(db_user, generation) if db_user is not None else None
+
+async def get_user_by_email_async(db: AsyncSession, email: str) -> CachedUser | None:
+    """get_user_by_email for the async endpoints; shares the same cache."""
+    cached = _cached_user(email)
+    if cached is not None:
+        return cached
+
+    generation = cache_invalidation.generation()
+    db_user = (await db.execute(_USER_BY_EMAIL_STMT, {"email": email})).scalar_one_or_none()
+    return _cache_user(db_user, generation) if db_user is not None else None
+
+def user_exists(db: Session, email: str) -> bool:
+    """Checks whether an email is registered with a single SELECT EXISTS, without loading the user."""
+    return db.execute(_USER_EXISTS_STMT, {"email": email}).scalar()
+
+async def user_exists_async(db: AsyncSession, email: str) -> bool:
+    """user_exists for the async endpoints."""
+    return (await db.execute(_USER_EXISTS_STMT, {"email": email})).scalar()
 
 def create_user(db: Session, user: schema.UserCreate, role: models.UserRole = models.UserRole.USER):
     """
@@ -36,90 +134,272 @@ def create_user(db: Session, user: schema.UserCreate, role: models.UserRole = mo
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+
+    with _user_cache_lock:
+        _user_cache.pop(db_user.email, None)
     return db_user
 
+async def create_user_async(db: AsyncSession, user: schema.UserCreate, role: models.UserRole = models.UserRole.USER):
+    """create_user for the async endpoints. The password is hashed on the hashing pool."""
+    hashed_password = await security.get_password_hash_async(user.password)
+
+    db_user = models.User(
+        email=user.email,
+        full_name=user.full_name,
+        hashed_password=hashed_password,
+        role=role
+    )
+
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+
+    with _user_cache_lock:
+        _user_cache.pop(db_user.email, None)
+    return db_user
+
+def _password_hash_update(user: CachedUser, hashed_password: str):
+    return (
+        update(models.User)
+        .where(models.User.id == user.id)
+        .values(hashed_password=hashed_password)
+    )
+
+def update_user_password_hash(db: Session, user: CachedUser, hashed_password: str):
+    """
+    Replaces a user's stored password hash, e.g. when upgrading a legacy bcrypt hash.
+    """
+    db.execute(_password_hash_update(user, hashed_password))
+    db.commit()
+
+    with _user_cache_lock:
+        _user_cache.pop(user.email, None)
+
+async def update_user_password_hash_async(db: AsyncSession, user: CachedUser, hashed_password: str):
+    """update_user_password_hash for the async endpoints."""
+    await db.execute(_password_hash_update(user, hashed_password))
+    await db.commit()
+
+    with _user_cache_lock:
+        _user_cache.pop(user.email, None)
+
 # --- Exam Attempt CRUD Functions ---
 
 def create_generated_exam(db: Session, user: models.User, exam_type: str, exam_name: str, stream: str | None, year: int | None, exam_data: dict) -> models.GeneratedExam:
     """Save a newly generated exam for the user."""
-    generated_exam = models.GeneratedExam(
-        user_id=user.id,
-        exam_type=exam_type,
-        exam_name=exam_name,
-        stream=stream,
-        year=year,
-        exam_data=exam_data,
-        generated_at=datetime.datetime.utcnow()
-    )
-    db.add(generated_exam)
+    # INSERT ... RETURNING hands back the id and server-side defaults in one round-trip
+    generated_exam = db.scalars(
+        insert(models.GeneratedExam)
+        .values(
+            user_id=user.id,
+            exam_type=exam_type,
+            exam_name=exam_name,
+            stream=stream,
+            year=year,
+            exam_data=exam_data,
+            is_complete=is_complete_exam(exam_data)
+        )
+        .returning(models.GeneratedExam)
+    ).one()
+    # Detach so the commit below doesn't expire the returned attributes
+    db.expunge(generated_exam)
     db.commit()
-    db.refresh(generated_exam)
     return generated_exam
 
+def is_complete_exam(exam_data: dict) -> bool:
+    """
+    Whether a generated exam can be reused for other requests: it has no top-level error, no
+    failed questions under "errors", and every section has questions. A failed LLM call produces
+    an exam with empty sections and every question under "errors".
+    """
+    if "error" in exam_data or exam_data.get("errors"):
+        return False
+    sections = [value for key, value in exam_data.items() if key != "errors" and isinstance(value, list)]
+    return bool(sections) and all(sections)
+
+def get_cached_exam_data(db: Session, exam_type: str, stream: str | None, year: int) -> dict | None:
+    """
+    Returns the exam_data of a previously generated exam with the same type, stream and year,
+    so it can be reused instead of generating a new one. Uses ix_generated_exams_lookup.
+    """
+    return db.scalars(
+        select(models.GeneratedExam.exam_data)
+        .where(
+            func.upper(models.GeneratedExam.exam_type) == exam_type.upper(),
+            func.upper(func.coalesce(models.GeneratedExam.stream, "")) == (stream or "").upper(),
+            models.GeneratedExam.year == year,
+            # Failed or partial generations are kept for their user but never handed out again
+            models.GeneratedExam.is_complete.is_(True),
+        )
+        .limit(1)
+    ).first()
+
 def get_generated_exams(db: Session, user: models.User, include_attempted: bool = False) -> List[models.GeneratedExam]:
-    """Get all generated exams for a user."""
-    query = db.query(models.GeneratedExam).filter(models.GeneratedExam.user_id == user.id)
+    """Get all generated exams for a user, without loading exam_data."""
+    query = (
+        db.query(models.GeneratedExam)
+        .options(defer(models.GeneratedExam.exam_data, raiseload=True))
+        .filter(models.GeneratedExam.user_id == user.id)
+    )
     if not include_attempted:
         query = query.filter(models.GeneratedExam.is_attempted == False)
     return query.order_by(models.GeneratedExam.generated_at.desc()).all()
 
+def get_generated_exam(db: Session, user: models.User, generated_exam_id: int) -> models.GeneratedExam | None:
+    """Get a single generated exam of the user, including exam_data."""
+    return (
+        db.query(models.GeneratedExam)
+        .filter(models.GeneratedExam.id == generated_exam_id, models.GeneratedExam.user_id == user.id)
+        .first()
+    )
+
+def _mark_attempted(generated_exam_id: int):
+    return (
+        update(models.GeneratedExam)
+        .where(models.GeneratedExam.id == generated_exam_id)
+        .values(is_attempted=True)
+        .execution_options(synchronize_session=False)
+    )
+
 def mark_exam_as_attempted(db: Session, generated_exam_id: int):
-    """Mark a generated exam as attempted."""
-    exam = db.query(models.GeneratedExam).filter(models.GeneratedExam.id == generated_exam_id).first()
-    if exam:
-        exam.is_attempted = True
-        db.commit()
+    """
+    Mark a generated exam as attempted.
+    Does not commit; the caller owns the transaction.
+    """
+    db.execute(_mark_attempted(generated_exam_id))
 
-def create_exam_attempt(db: Session, user: models.User, submission: schema.ExamSubmissionRequest) -> models.ExamAttempt:
-    attempt = models.ExamAttempt(
-        user_id=user.id,
-        generated_exam_id=submission.generated_exam_id,
-        exam_type=submission.exam_type,
-        exam_name=submission.exam_name,
-        stream=submission.stream,
-        year=submission.year,
-        score=submission.score,
-        total_questions=submission.total_questions,
-        correct_answers=submission.correct_answers,
-        wrong_answers=submission.wrong_answers,
-        unanswered=submission.unanswered,
-        percentage=int(submission.percentage) if submission.percentage else None,
-        time_taken=submission.time_taken,
-        exam_data=submission.exam_data,
-        submitted_at=datetime.datetime.utcnow()
+def _exam_attempt_insert(user: models.User, submission: schema.ExamSubmissionRequest):
+    # INSERT ... RETURNING hands back the full row in one round-trip, so no refresh() is needed
+    return (
+        insert(models.ExamAttempt)
+        .values(
+            user_id=user.id,
+            generated_exam_id=submission.generated_exam_id,
+            exam_type=submission.exam_type,
+            exam_name=submission.exam_name,
+            stream=submission.stream,
+            year=submission.year,
+            score=submission.score,
+            total_questions=submission.total_questions,
+            correct_answers=submission.correct_answers,
+            wrong_answers=submission.wrong_answers,
+            unanswered=submission.unanswered,
+            percentage=int(submission.percentage) if submission.percentage else None,
+            time_taken=submission.time_taken,
+            exam_data=submission.exam_data
+        )
+        .returning(models.ExamAttempt)
     )
-    db.add(attempt)
+
+def create_exam_attempt(db: Session, user: models.User, submission: schema.ExamSubmissionRequest) -> models.ExamAttempt:
+    attempt = db.scalars(_exam_attempt_insert(user, submission)).one()
+    # Detach so the commit below doesn't expire the returned attributes
+    db.expunge(attempt)
     
-    # Mark the generated exam as attempted if applicable
+    # Mark the generated exam as attempted in the same transaction
     if submission.generated_exam_id:
         mark_exam_as_attempted(db, submission.generated_exam_id)
     
     db.commit()
-    db.refresh(attempt)
     return attempt
 
-def get_exam_attempts(db: Session, user: models.User, limit: int = 20) -> List[models.ExamAttempt]:
+async def create_exam_attempt_async(db: AsyncSession, user: models.User, submission: schema.ExamSubmissionRequest) -> models.ExamAttempt:
+    """create_exam_attempt for the async endpoints."""
+    # AsyncSessionLocal doesn't expire on commit, so the returned row stays loaded
+    attempt = (await db.scalars(_exam_attempt_insert(user, submission))).one()
+
+    # Mark the generated exam as attempted in the same transaction
+    if submission.generated_exam_id:
+        await db.execute(_mark_attempted(submission.generated_exam_id))
+
+    await db.commit()
+    return attempt
+
+def _exam_attempts_query(user: models.User, limit: int, cursor: datetime.datetime | None, cursor_id: int | None):
+    query = (
+        select(models.ExamAttempt)
+        .options(defer(models.ExamAttempt.exam_data, raiseload=True))
+        .where(models.ExamAttempt.user_id == user.id)
+    )
+    if cursor is not None and cursor_id is not None:
+        # Row comparison, so attempts sharing the boundary timestamp are not skipped
+        query = query.where(tuple_(models.ExamAttempt.submitted_at, models.ExamAttempt.id) < tuple_(cursor, cursor_id))
+    elif cursor is not None:
+        query = query.where(models.ExamAttempt.submitted_at < cursor)
+    # Matches ix_exam_attempts_user_submitted_id, so a page is a single index range scan
+    return query.order_by(models.ExamAttempt.submitted_at.desc(), models.ExamAttempt.id.desc()).limit(limit)
+
+def get_exam_attempts(db: Session, user: models.User, limit: int = 20, cursor: datetime.datetime | None = None, cursor_id: int | None = None) -> List[models.ExamAttempt]:
+    """
+    Get a user's exam attempts, newest first.
+    Pass the submitted_at and id of the last attempt on the previous page as `cursor` and
+    `cursor_id` to get the next page.
+    exam_data is not loaded; use get_exam_attempt for the full attempt.
+    """
+    return db.scalars(_exam_attempts_query(user, limit, cursor, cursor_id)).all()
+
+async def get_exam_attempts_async(db: AsyncSession, user: models.User, limit: int = 20, cursor: datetime.datetime | None = None, cursor_id: int | None = None) -> List[models.ExamAttempt]:
+    """get_exam_attempts for the async endpoints."""
+    return (await db.scalars(_exam_attempts_query(user, limit, cursor, cursor_id))).all()
+
+def get_exam_attempt(db: Session, user: models.User, attempt_id: int) -> models.ExamAttempt | None:
+    """Get a single exam attempt of the user, including exam_data."""
     return (
         db.query(models.ExamAttempt)
-        .filter(models.ExamAttempt.user_id == user.id)
-        .order_by(models.ExamAttempt.submitted_at.desc())
-        .limit(limit)
-        .all()
+        .filter(models.ExamAttempt.id == attempt_id, models.ExamAttempt.user_id == user.id)
+        .first()
     )
 
 # --- Subscription CRUD Functions ---
 
-def get_subscription_by_user_id(db: Session, user_id: int):
+# Short-lived cache of user_id -> CachedSubscription (or _NO_SUBSCRIPTION), so
+# subscriber checks don't hit the database on every request. Entries are evicted on
+# every worker when the subscription row is written (see cache_invalidation).
+_NO_SUBSCRIPTION = object()
+_subscription_cache: TTLCache = TTLCache(maxsize=10_000, ttl=30)
+_subscription_cache_lock = threading.Lock()
+
+@cache_invalidation.on_invalidate
+def _evict_subscription(user_id: int | None):
+    with _subscription_cache_lock:
+        if user_id is None:
+            _subscription_cache.clear()
+        else:
+            _subscription_cache.pop(user_id, None)
+
+def _cache_subscription(user_id: int, db_subscription: models.Subscription | None, generation: int) -> CachedSubscription | None:
     """
-    Retrieves a user's subscription from the database.
+    Stores a snapshot of the given subscription row in the subscription cache, unless an
+    invalidation arrived since `generation` was read.
     """
-    return db.query(models.Subscription).filter(models.Subscription.user_id == user_id).first()
+    cached = CachedSubscription(
+        is_active=db_subscription.is_active,
+        expires_at=db_subscription.expires_at,
+        payment_customer_id=db_subscription.payment_customer_id,
+    ) if db_subscription else None
+    if cache_invalidation.generation() == generation:
+        with _subscription_cache_lock:
+            _subscription_cache[user_id] = cached if cached is not None else _NO_SUBSCRIPTION
+    return cached
 
-def create_or_update_subscription(db: Session, user_id: int, payment_customer_id: str, is_active: bool, expires_at: datetime):
+def get_subscription_by_user_id(db: Session, user_id: int) -> CachedSubscription | None:
+    """
+    Retrieves a user's subscription state, from the cache when possible.
+    """
+    with _subscription_cache_lock:
+        cached = _subscription_cache.get(user_id)
+    if cached is not None:
+        return None if cached is _NO_SUBSCRIPTION else cached
+
+    generation = cache_invalidation.generation()
+    db_subscription = db.query(models.Subscription).filter(models.Subscription.user_id == user_id).first()
+    return _cache_subscription(user_id, db_subscription, generation)
+
+def create_or_update_subscription(db: Session, user_id: int, payment_customer_id: str, is_active: bool, expires_at: datetime.datetime):
     """
     Creates a new subscription for a user or updates their existing one.
     """
-    db_subscription = get_subscription_by_user_id(db, user_id=user_id)
+    db_subscription = db.query(models.Subscription).filter(models.Subscription.user_id == user_id).first()
     
     if db_subscription:
         db_subscription.is_active = is_active
@@ -136,5 +416,8 @@ def create_or_update_subscription(db: Session, user_id: int, payment_customer_id
         
     db.commit()
     db.refresh(db_subscription)
+
+    with _subscription_cache_lock:
+        _subscription_cache.pop(user_id, None)
     return db_subscription
 
@@ -1,17 +1,80 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from .config import settings
+from uuid import uuid4
 
 # --- 1. Database Connection URL ---
 # This uses the settings from your config.py file to build the connection string
 DATABASE_URL = settings.DATABASE_URL
 
 # --- 2. SQLAlchemy Engine ---
-engine = create_engine(DATABASE_URL)
+# executemany_mode="values_plus_batch" lets psycopg2 fold multi-row INSERTs into
+# a single multi-VALUES statement and batch executemany UPDATE/DELETEs, e.g.
+# session.execute(insert(Model), [dict, dict, ...]) is one round-trip.
+# The engine is created once at import and shared by the API, seed and migration scripts.
+# query_cache_size is raised from the default 500 so every compiled statement the app
+# issues, including the auth lookups, stays in SQLAlchemy's compiled SQL cache.
+if settings.DB_USE_PGBOUNCER:
+    # PgBouncer owns the pool; keep a statement timeout so a stuck query can't pin a server connection
+    engine = create_engine(
+        DATABASE_URL,
+        executemany_mode="values_plus_batch",
+        query_cache_size=1200,
+        poolclass=NullPool,
+        connect_args={"options": "-c statement_timeout=5000"},
+    )
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        executemany_mode="values_plus_batch",
+        query_cache_size=1200,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=True,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+    )
+
+# The hot request endpoints (register, login, exam submission and history) use an
+# asyncpg engine instead, so they wait on the database without holding a worker thread.
+if settings.DB_USE_PGBOUNCER:
+    # Under transaction pooling a prepared statement can't be assumed to exist on the next
+    # server connection, so asyncpg's and SQLAlchemy's statement caches are disabled and every
+    # statement gets a unique name. PgBouncer rejects statement_timeout as a startup
+    # parameter, so it is set at the start of each transaction instead.
+    async_engine = create_async_engine(
+        settings.ASYNC_DATABASE_URL,
+        query_cache_size=1200,
+        poolclass=NullPool,
+        connect_args={
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        },
+    )
+
+    @event.listens_for(async_engine.sync_engine, "begin")
+    def _set_statement_timeout(conn):
+        conn.exec_driver_sql("SET LOCAL statement_timeout = 5000")
+else:
+    # Sized separately from the sync pool; the two together are what one worker may open
+    async_engine = create_async_engine(
+        settings.ASYNC_DATABASE_URL,
+        query_cache_size=1200,
+        pool_size=settings.ASYNC_DB_POOL_SIZE,
+        max_overflow=settings.ASYNC_DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=True,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+    )
 
 # --- 3. Session Factory ---
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: attributes can't be lazily reloaded after a commit in async code
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # --- 4. Declarative Base ---
 # Base is DEFINED here. Other files (like models.py) will import it from this file.
@@ -27,3 +90,10 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    """
+    A FastAPI dependency that provides an AsyncSession for a single API request.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,37 +1,82 @@
-from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text, bindparam
+from contextlib import asynccontextmanager
+import orjson
 import uuid
 import asyncio
+import logging
+from datetime import datetime
 
 # Import all the necessary modules from your application structure
-from . import crud, models, schema, security, payments, database
-from .rag_service import RAGService
-# Create the database tables if they don't exist
-try:
-    with database.engine.connect() as connection:
-        connection.execute(text("ALTER TABLE IF EXISTS users ADD COLUMN IF NOT EXISTS full_name VARCHAR"))
-        connection.commit()
-    models.Base.metadata.create_all(bind=database.engine)
-    print("Database tables checked/created successfully.")
-except Exception as e:
-    print(f"Error creating database tables: {e}")
+from . import crud, models, schema, security, payments, database, config, cache_invalidation
+from .task_store import create_task_store
+from .rag_service import RAGService, GATE_STREAMS
+
+logger = logging.getLogger(__name__)
+
+def _already_migrated(engine) -> bool:
+    """Checks with a single catalog query whether every model table already exists."""
+    table_names = list(models.Base.metadata.tables.keys())
+    query = text(
+        "SELECT count(*) FROM pg_catalog.pg_tables "
+        "WHERE schemaname = current_schema() AND tablename IN :names"
+    ).bindparams(bindparam("names", expanding=True))
+    with engine.connect() as connection:
+        return connection.execute(query, {"names": table_names}).scalar_one() == len(table_names)
+
+def _auto_migrate():
+    try:
+        if _already_migrated(database.engine):
+            print("Database tables already exist, skipping create_all.")
+            return
+        models.Base.metadata.create_all(bind=database.engine)
+        print("Database tables checked/created successfully.")
+    except Exception as e:
+        print(f"Error creating database tables: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema changes are applied once per deploy with the fastapi_app.migrate_* scripts.
+    # For local development, AUTO_MIGRATE=1 creates any missing tables on start-up.
+    if config.settings.AUTO_MIGRATE:
+        await run_in_threadpool(_auto_migrate)
+    cache_invalidation.start_listener()
+    yield
+    cache_invalidation.stop_listener()
+    await database.async_engine.dispose()
+
+class UTCORJSONResponse(ORJSONResponse):
+    """ORJSONResponse that writes UTC datetimes with a "Z" suffix, like Pydantic's JSON mode does."""
+    def render(self, content) -> bytes:
+        return orjson.dumps(
+            content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z
+        )
 
 # --- FastAPI App Initialization ---
 app = FastAPI(
     title="CAT/GATE Mock Test Platform API",
     description="An AI-powered platform to generate mock exams with a secure payment and user system.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # orjson encodes the large exam_data payloads much faster than stdlib json
+    default_response_class=UTCORJSONResponse
 )
 
 # --- CORS Middleware ---
+# Wildcard origins are not valid together with credentials, so origins are listed explicitly.
+# max_age lets browsers cache preflight responses for a day.
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Allows all origins
+    allow_origins=config.settings.CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],  # Allows all methods
-    allow_headers=["*"],  # Allows all headers
+    allow_methods=["GET", "POST"],
+    allow_headers=["authorization", "content-type"],
+    max_age=86400,
 )
 
 # --- Initialize the RAG Services ---
@@ -44,21 +89,25 @@ app.add_middleware(
 # --- Authentication Endpoints ---
 
 @app.post("/register", response_model=schema.User, status_code=status.HTTP_201_CREATED, tags=["Authentication"])
-def register_user(user: schema.UserCreate, db: Session = Depends(database.get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
-    if db_user:
+async def register_user(user: schema.UserCreate, db: AsyncSession = Depends(database.get_async_db)):
+    if await crud.user_exists_async(db, email=user.email):
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    return await crud.create_user_async(db=db, user=user)
 
 @app.post("/token", response_model=schema.Token, tags=["Authentication"])
-def login_for_access_token(form_data: schema.OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = crud.get_user_by_email(db, email=form_data.username)
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: schema.OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_async_db)):
+    user = await crud.get_user_by_email_async(db, email=form_data.username)
+    if not user or not await security.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    # Transparently upgrade legacy bcrypt hashes to argon2id
+    if security.password_needs_rehash(user.hashed_password):
+        new_hash = await security.get_password_hash_async(form_data.password)
+        await crud.update_user_password_hash_async(db, user, new_hash)
     
     access_token = security.create_access_token(
         data={
@@ -72,87 +121,113 @@ def login_for_access_token(form_data: schema.OAuth2PasswordRequestForm = Depends
 
 # --- Information Endpoints ---
 
+# Map stream codes to full names for better UX
+GATE_STREAM_NAMES = {
+    "AE": "Aerospace Engineering",
+    "AG": "Agricultural Engineering", 
+    "AR": "Architecture and Planning",
+    "BM": "Biomedical Engineering",
+    "BT": "Biotechnology",
+    "CE": "Civil Engineering",
+    "CH": "Chemical Engineering",
+    "CS": "Computer Science and Information Technology",
+    "CY": "Chemistry",
+    "DA": "Data Science and Artificial Intelligence",
+    "EC": "Electronics and Communication Engineering",
+    "EE": "Electrical Engineering",
+    "EN": "Environmental Science and Engineering",
+    "ES": "Earth Sciences",
+    "EY": "Ecology and Evolution",
+    "GE": "Geology and Geophysics",
+    "GG": "Geophysics",
+    "IN": "Instrumentation Engineering",
+    "MA": "Mathematics",
+    "ME": "Mechanical Engineering",
+    "MN": "Mining Engineering",
+    "MT": "Metallurgical Engineering",
+    "NM": "Naval Architecture and Marine Engineering",
+    "PE": "Petroleum Engineering",
+    "PH": "Physics",
+    "PI": "Production and Industrial Engineering",
+    "ST": "Statistics",
+    "TF": "Textile Engineering and Fibre Science",
+    "XE": "Engineering Sciences",
+    "XL": "Life Sciences"
+}
+
+# /gate-streams is static, so the JSON body is built once at import
+_GATE_STREAMS_BYTES = orjson.dumps({
+    "total_streams": len(GATE_STREAMS),
+    "streams": [{"code": code, "name": GATE_STREAM_NAMES.get(code, "Unknown")} for code in GATE_STREAMS]
+})
+
 @app.get("/gate-streams", tags=["Information"])
-def get_gate_streams():
+async def get_gate_streams():
     """
     Returns a list of all 30 supported GATE streams.
     Useful for frontend dropdown menus and validation.
     """
-    from .rag_service import GATE_STREAMS
-    
-    # Map stream codes to full names for better UX
-    stream_info = {
-        "AE": "Aerospace Engineering",
-        "AG": "Agricultural Engineering", 
-        "AR": "Architecture and Planning",
-        "BM": "Biomedical Engineering",
-        "BT": "Biotechnology",
-        "CE": "Civil Engineering",
-        "CH": "Chemical Engineering",
-        "CS": "Computer Science and Information Technology",
-        "CY": "Chemistry",
-        "DA": "Data Science and Artificial Intelligence",
-        "EC": "Electronics and Communication Engineering",
-        "EE": "Electrical Engineering",
-        "EN": "Environmental Science and Engineering",
-        "ES": "Earth Sciences",
-        "EY": "Ecology and Evolution",
-        "GE": "Geology and Geophysics",
-        "GG": "Geophysics",
-        "IN": "Instrumentation Engineering",
-        "MA": "Mathematics",
-        "ME": "Mechanical Engineering",
-        "MN": "Mining Engineering",
-        "MT": "Metallurgical Engineering",
-        "NM": "Naval Architecture and Marine Engineering",
-        "PE": "Petroleum Engineering",
-        "PH": "Physics",
-        "PI": "Production and Industrial Engineering",
-        "ST": "Statistics",
-        "TF": "Textile Engineering and Fibre Science",
-        "XE": "Engineering Sciences",
-        "XL": "Life Sciences"
-    }
-    
-    return {
-        "total_streams": len(GATE_STREAMS),
-        "streams": [{"code": code, "name": stream_info.get(code, "Unknown")} for code in GATE_STREAMS]
-    }
+    return Response(
+        content=_GATE_STREAMS_BYTES,
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=86400, immutable"},
+    )
+
+# --- Task Store ---
+# Backed by Redis when REDIS_URL is set so /exam-status works across workers
+exam_tasks = create_task_store(config.settings.REDIS_URL)
 
-# --- In-Memory Task Store (for demo purposes) ---
-# In production, use Redis or a database
-exam_tasks = {}
+def _find_cached_exam(request: schema.ExamGenerationRequest) -> dict | None:
+    """Looks up a previously generated exam for the same year that can be reused."""
+    # Only exams generated for a specific year are reused
+    if not request.year:
+        return None
+    with database.SessionLocal() as db_session:
+        return crud.get_cached_exam_data(db_session, request.exam_type, request.stream, request.year)
 
-async def run_exam_generation(task_id: str, request: schema.ExamGenerationRequest, user_id: int, db_session):
+async def run_exam_generation(task_id: str, request: schema.ExamGenerationRequest, user_id: int):
     try:
         print(f"Task {task_id}: Starting generation for user {user_id}")
-        rag_service = RAGService(request.exam_type)
-        generated_exam = await rag_service.generate_full_exam(
-            exam_name=request.exam_type,
-            stream=request.stream,
-            year=request.year
-        )
-        
-        # Save the generated exam to database
-        user = db_session.query(models.User).filter(models.User.id == user_id).first()
-        if user:
-            saved_exam = crud.create_generated_exam(
-                db_session,
-                user,
-                request.exam_type,
-                request.exam_name,
-                request.stream,
-                request.year,
-                generated_exam
-            )
-            exam_tasks[task_id] = {"status": "completed", "result": generated_exam, "exam_id": saved_exam.id}
+        generated_exam = await run_in_threadpool(_find_cached_exam, request)
+        if generated_exam:
+            print(f"Task {task_id}: Using cached exam - no AI generation needed!")
         else:
-            exam_tasks[task_id] = {"status": "completed", "result": generated_exam}
+            # Loading source questions (and the model on first use) blocks, so keep it off the event loop
+            rag_service = await run_in_threadpool(RAGService, request.exam_type)
+            try:
+                generated_exam = await rag_service.generate_full_exam(
+                    exam_name=request.exam_type,
+                    stream=request.stream,
+                    year=request.year
+                )
+            finally:
+                await rag_service.close()
+        
+        # Save the generated exam to database. The request's session is already closed
+        # by the time this task runs, so use a fresh one and only hold it for the write.
+        task_result = {"status": "completed", "result": generated_exam}
+        if not crud.is_complete_exam(generated_exam):
+            # Still saved for this user; create_generated_exam flags it so it is never reused
+            logger.warning(f"Task {task_id}: Exam has failed questions or empty sections; it will not be reused")
+        with database.SessionLocal() as db_session:
+            user = db_session.query(models.User).filter(models.User.id == user_id).first()
+            if user:
+                saved_exam = crud.create_generated_exam(
+                    db_session,
+                    user,
+                    request.exam_type,
+                    request.exam_name,
+                    request.stream,
+                    request.year,
+                    generated_exam
+                )
+                task_result["exam_id"] = saved_exam.id
+        await exam_tasks.set(task_id, task_result)
         
         print(f"Task {task_id}: Completed successfully")
     except Exception as e:
         print(f"Task {task_id}: Failed with error: {e}")
-        exam_tasks[task_id] = {"status": "failed", "error": str(e)}
+        await exam_tasks.set(task_id, {"status": "failed", "error": str(e)})
 
 # --- Core Application Endpoint ---
 
@@ -161,17 +236,16 @@ async def run_exam_generation(task_id: str, request: schema.ExamGenerationReques
 async def generate_new_exam(
     request: schema.ExamGenerationRequest,
     background_tasks: BackgroundTasks,
-    current_user: models.User = Depends(security.get_current_user),
-    db: Session = Depends(database.get_db)
+    current_user: models.User = Depends(security.get_current_user)
 ):
     """
     Start generating a new mock exam in the background.
     Returns a task_id to poll for status.
     """
     task_id = str(uuid.uuid4())
-    exam_tasks[task_id] = {"status": "processing"}
+    await exam_tasks.set(task_id, {"status": "processing"})
     
-    background_tasks.add_task(run_exam_generation, task_id, request, current_user.id, db)
+    background_tasks.add_task(run_exam_generation, task_id, request, current_user.id)
     
     return {"task_id": task_id, "status": "processing", "message": "Exam generation started"}
 
@@ -180,7 +254,7 @@ async def get_exam_status(task_id: str, current_user: models.User = Depends(secu
     """
     Check the status of an exam generation task.
     """
-    task = exam_tasks.get(task_id)
+    task = await exam_tasks.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
@@ -192,7 +266,8 @@ async def get_exam_status(task_id: str, current_user: models.User = Depends(secu
         # Include exam_id if available
         if "exam_id" in task:
             result["exam_id"] = task["exam_id"]
-        return result
+        # Plain JSON from the task store, so skip jsonable_encoder
+        return UTCORJSONResponse(result)
     elif task["status"] == "failed":
         return {"status": "failed", "error": task.get("error")}
     else:
@@ -200,41 +275,86 @@ async def get_exam_status(task_id: str, current_user: models.User = Depends(secu
 
 # --- Exam Submission Endpoints ---
 
+# The exam detail endpoints return UTCORJSONResponse directly: the rows were validated on the way
+# in and exam_data is already JSON-compatible, so the response_model (kept for the OpenAPI
+# docs) and FastAPI's recursive jsonable_encoder pass would only copy the payload around.
+_GENERATED_EXAM_FIELDS = tuple(schema.GeneratedExamResponse.model_fields)
+_EXAM_ATTEMPT_FIELDS = tuple(schema.ExamAttemptResponse.model_fields)
+
+def _row_response(row, fields) -> UTCORJSONResponse:
+    # UTCORJSONResponse keeps timestamps in the same "...Z" form as the response_model endpoints
+    return UTCORJSONResponse({field: getattr(row, field) for field in fields})
+
 @app.post("/submit-exam", response_model=schema.ExamAttemptResponse, tags=["Exam Submission"])
-def submit_exam(
+async def submit_exam(
     submission: schema.ExamSubmissionRequest,
-    current_user: models.User = Depends(security.get_current_user),
-    db: Session = Depends(database.get_db)
+    current_user: models.User = Depends(security.get_current_user_async),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    attempt = crud.create_exam_attempt(db, current_user, submission)
-    return attempt
+    attempt = await crud.create_exam_attempt_async(db, current_user, submission)
+    return _row_response(attempt, _EXAM_ATTEMPT_FIELDS)
 
-@app.get("/generated-exams", response_model=list[schema.GeneratedExamResponse], tags=["Exam Generation"])
+@app.get("/generated-exams", response_model=list[schema.GeneratedExamSummary], tags=["Exam Generation"])
 def get_generated_exams(
     current_user: models.User = Depends(security.get_current_user),
     db: Session = Depends(database.get_db),
     include_attempted: bool = False
 ):
-    """Get all exams generated by the user (available exams)."""
+    """
+    Get all exams generated by the user (available exams).
+    The questions are not included; fetch them with /generated-exams/{exam_id}.
+    """
     exams = crud.get_generated_exams(db, current_user, include_attempted=include_attempted)
     return exams
 
-@app.get("/exam-history", response_model=list[schema.ExamAttemptResponse], tags=["Exam Submission"])
-def get_exam_history(
+@app.get("/generated-exams/{exam_id}", response_model=schema.GeneratedExamResponse, tags=["Exam Generation"])
+def get_generated_exam(
+    exam_id: int,
     current_user: models.User = Depends(security.get_current_user),
-    db: Session = Depends(database.get_db),
-    limit: int = 20
+    db: Session = Depends(database.get_db)
 ):
-    """Get all completed exam attempts with detailed statistics."""
-    attempts = crud.get_exam_attempts(db, current_user, limit=limit)
+    """Get a single generated exam, including its questions."""
+    exam = crud.get_generated_exam(db, current_user, exam_id)
+    if not exam:
+        raise HTTPException(status_code=404, detail="Generated exam not found")
+    return _row_response(exam, _GENERATED_EXAM_FIELDS)
+
+@app.get("/exam-history", response_model=list[schema.ExamAttemptSummary], tags=["Exam Submission"])
+async def get_exam_history(
+    current_user: models.User = Depends(security.get_current_user_async),
+    db: AsyncSession = Depends(database.get_async_db),
+    limit: int = 20,
+    cursor: datetime | None = None,
+    cursor_id: int | None = None
+):
+    """
+    Get completed exam attempts with detailed statistics, newest first.
+    To fetch the next page, pass the submitted_at and id of the last attempt as `cursor` and `cursor_id`.
+    """
+    attempts = await crud.get_exam_attempts_async(db, current_user, limit=limit, cursor=cursor, cursor_id=cursor_id)
     return attempts
 
+@app.get("/exam-history/{attempt_id}", response_model=schema.ExamAttemptResponse, tags=["Exam Submission"])
+def get_exam_attempt(
+    attempt_id: int,
+    current_user: models.User = Depends(security.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    """Get a single exam attempt, including its full exam_data."""
+    attempt = crud.get_exam_attempt(db, current_user, attempt_id)
+    if not attempt:
+        raise HTTPException(status_code=404, detail="Exam attempt not found")
+    return _row_response(attempt, _EXAM_ATTEMPT_FIELDS)
+
 # --- Admin-Only Endpoint for Demo ---
 
 @app.get("/admin/dashboard", tags=["Admin"])
-def get_admin_dashboard(current_admin: models.User = Depends(security.get_current_admin_user)):
+async def get_admin_dashboard(current_admin: models.User = Depends(security.get_current_admin_user)):
     """
     An example of a protected endpoint that is only accessible to users with the 'admin' role.
     """
-    return {"message": f"Welcome to the admin dashboard, {current_admin.email}!"}
+    return {
+        "message": f"Welcome to the admin dashboard, {current_admin.email}!",
+        "exam_tasks": exam_tasks.stats(),
+    }
 
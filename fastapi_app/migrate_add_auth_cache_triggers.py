@@ -0,0 +1,34 @@
+"""
+Migration script to add the triggers that notify every API worker when a user's cached
+auth fields or subscription change, so the workers evict the user from their caches.
+Also removes the users.version column and trigger used by earlier builds for the same purpose.
+"""
+from sqlalchemy import text
+from fastapi_app.database import engine
+from fastapi_app.models import USERS_AUTH_CACHE_TRIGGER_SQL, SUBSCRIPTIONS_AUTH_CACHE_TRIGGER_SQL
+
+def run_migration():
+    print("Starting database migration to add auth cache triggers...")
+
+    try:
+        with engine.begin() as conn:
+            print("Removing the users_bump_version trigger and version column, if present...")
+            conn.execute(text("DROP TRIGGER IF EXISTS users_bump_version ON users"))
+            conn.execute(text("DROP FUNCTION IF EXISTS bump_user_version()"))
+            conn.execute(text("ALTER TABLE IF EXISTS users DROP COLUMN IF EXISTS version"))
+            print("Creating the users_notify_auth_cache trigger...")
+            for statement in USERS_AUTH_CACHE_TRIGGER_SQL:
+                conn.execute(text(statement))
+            print("Creating the subscriptions_notify_auth_cache trigger...")
+            for statement in SUBSCRIPTIONS_AUTH_CACHE_TRIGGER_SQL:
+                conn.execute(text(statement))
+    except Exception as e:
+        print(f"\nERROR: Migration failed: {e}")
+        raise
+
+    print("\n" + "="*60)
+    print("Migration completed successfully!")
+    print("="*60)
+
+if __name__ == "__main__":
+    run_migration()
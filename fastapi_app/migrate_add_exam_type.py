@@ -3,72 +3,48 @@ Migration script to add exam_type column to generated_exams and exam_attempts ta
 """
 from sqlalchemy import text
 from fastapi_app.database import engine
+from fastapi_app.migrate_add_generated_exam_columns import create_index_concurrently
 
 def run_migration():
     print("Starting database migration to add exam_type column...")
     
-    with engine.connect() as conn:
-        trans = conn.begin()
-        
-        try:
-            # Add exam_type column to generated_exams
-            print("Adding exam_type column to generated_exams...")
-            conn.execute(text("""
-                DO $$ 
-                BEGIN
-                    IF NOT EXISTS (
-                        SELECT 1 FROM information_schema.columns 
-                        WHERE table_name = 'generated_exams' 
-                        AND column_name = 'exam_type'
-                    ) THEN
-                        ALTER TABLE generated_exams 
-                        ADD COLUMN exam_type VARCHAR NOT NULL DEFAULT 'cat';
-                        
-                        -- Update existing records based on exam_name
-                        UPDATE generated_exams 
-                        SET exam_type = CASE 
-                            WHEN LOWER(exam_name) LIKE '%gate%' THEN 'gate'
-                            WHEN LOWER(exam_name) = 'gate' THEN 'gate'
-                            ELSE 'cat'
-                        END;
-                    END IF;
-                END $$;
-            """))
-            
-            # Add exam_type column to exam_attempts
-            print("Adding exam_type column to exam_attempts...")
-            conn.execute(text("""
-                DO $$ 
-                BEGIN
-                    IF NOT EXISTS (
-                        SELECT 1 FROM information_schema.columns 
-                        WHERE table_name = 'exam_attempts' 
-                        AND column_name = 'exam_type'
-                    ) THEN
-                        ALTER TABLE exam_attempts 
-                        ADD COLUMN exam_type VARCHAR NOT NULL DEFAULT 'cat';
-                        
-                        -- Update existing records based on exam_name
-                        UPDATE exam_attempts 
-                        SET exam_type = CASE 
-                            WHEN LOWER(exam_name) LIKE '%gate%' THEN 'gate'
-                            WHEN LOWER(exam_name) = 'gate' THEN 'gate'
-                            ELSE 'cat'
-                        END;
-                    END IF;
-                END $$;
-            """))
-            
-            trans.commit()
-            print("\n" + "="*60)
-            print("Migration completed successfully!")
-            print("Added exam_type column to both generated_exams and exam_attempts")
-            print("="*60)
-            
-        except Exception as e:
-            trans.rollback()
-            print(f"\nERROR: Migration failed: {e}")
-            raise
+    try:
+        with engine.begin() as conn:
+            # The column is added nullable first so rows that predate it can be backfilled
+            # from exam_name; on re-runs ADD COLUMN IF NOT EXISTS is a no-op and the
+            # backfill matches no rows, so no information_schema probe is needed.
+            for table in ("generated_exams", "exam_attempts"):
+                print(f"Adding exam_type column to {table}...")
+                conn.execute(text(f"""
+                    ALTER TABLE {table} ADD COLUMN IF NOT EXISTS exam_type VARCHAR;
+                    
+                    -- Update existing records based on exam_name
+                    UPDATE {table} 
+                    SET exam_type = CASE 
+                        WHEN LOWER(exam_name) LIKE '%gate%' THEN 'gate'
+                        ELSE 'cat'
+                    END
+                    WHERE exam_type IS NULL;
+                    
+                    ALTER TABLE {table} 
+                        ALTER COLUMN exam_type SET DEFAULT 'cat',
+                        ALTER COLUMN exam_type SET NOT NULL;
+                """))
+    except Exception as e:
+        print(f"\nERROR: Migration failed: {e}")
+        raise
+    
+    # Index used to reuse previously generated exams of the same type, stream and year
+    print("Creating index ix_generated_exams_lookup...")
+    create_index_concurrently(
+        "ix_generated_exams_lookup",
+        "generated_exams(UPPER(exam_type), UPPER(COALESCE(stream, '')), year)"
+    )
+    
+    print("\n" + "="*60)
+    print("Migration completed successfully!")
+    print("Added exam_type column to both generated_exams and exam_attempts")
+    print("="*60)
 
 if __name__ == "__main__":
     run_migration()
@@ -2,17 +2,53 @@
 Migration script to add new columns to existing tables.
 This adds the new GeneratedExam table and updates ExamAttempt table.
 """
+import time
 from sqlalchemy import text
 from fastapi_app.database import engine
 
+# Indexes built with CREATE INDEX CONCURRENTLY once the DDL transaction has committed,
+# so API writes to the tables are not blocked while they build.
+CONCURRENT_INDEXES = {
+    "ix_generated_exams_user_id": "generated_exams(user_id)",
+    "ix_exam_attempts_user_submitted_id": "exam_attempts(user_id, submitted_at DESC, id DESC)",
+}
+# Superseded by an index above and dropped once it exists
+REDUNDANT_INDEXES = ["ix_exam_attempts_user_id", "ix_exam_attempts_user_submitted"]
+INDEX_RETRIES = 3
+
+# Finds an index of this name left INVALID by an interrupted concurrent build
+INVALID_INDEX_QUERY = text("""
+    SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE c.relname = :name AND pg_catalog.pg_table_is_visible(c.oid) AND NOT i.indisvalid
+""")
+
+def create_index_concurrently(name: str, definition: str):
+    """
+    CREATE INDEX CONCURRENTLY cannot run inside a transaction block, so it uses its own
+    AUTOCOMMIT connection. A failed concurrent build (e.g. a collision with another migrator,
+    or an earlier run that was killed mid-build) leaves an INVALID index behind. IF NOT EXISTS
+    would silently keep it, so it is dropped before each attempt.
+    """
+    for attempt in range(1, INDEX_RETRIES + 1):
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if conn.execute(INVALID_INDEX_QUERY, {"name": name}).first() is not None:
+                print(f"Dropping invalid index {name} left by an earlier build...")
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            try:
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}"))
+                return
+            except Exception as e:
+                if attempt == INDEX_RETRIES:
+                    raise
+                print(f"Index {name} failed on attempt {attempt}: {e}. Retrying...")
+        time.sleep(attempt)
+
 def run_migration():
     print("Starting database migration...")
     
-    with engine.connect() as conn:
-        # Start a transaction
-        trans = conn.begin()
-        
-        try:
+    try:
+        # engine.begin() commits when the block exits and rolls back if any statement fails
+        with engine.begin() as conn:
             # 1. Create generated_exams table if it doesn't exist
             print("Creating generated_exams table...")
             conn.execute(text("""
@@ -22,137 +58,55 @@ def run_migration():
                     exam_name VARCHAR NOT NULL,
                     stream VARCHAR,
                     year INTEGER,
-                    generated_at TIMESTAMP NOT NULL DEFAULT NOW(),
-                    exam_data JSON NOT NULL,
-                    is_attempted BOOLEAN DEFAULT FALSE
+                    generated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                    exam_data JSONB NOT NULL,
+                    is_attempted BOOLEAN DEFAULT FALSE,
+                    is_complete BOOLEAN NOT NULL DEFAULT TRUE
                 );
             """))
-            
-            # 2. Create index on user_id for generated_exams
-            print("Creating index on generated_exams...")
-            conn.execute(text("""
-                CREATE INDEX IF NOT EXISTS ix_generated_exams_user_id 
-                ON generated_exams(user_id);
-            """))
-            
-            # 3. Add generated_exam_id column to exam_attempts if it doesn't exist
-            print("Adding generated_exam_id column to exam_attempts...")
-            conn.execute(text("""
-                DO $$ 
-                BEGIN
-                    IF NOT EXISTS (
-                        SELECT 1 FROM information_schema.columns 
-                        WHERE table_name = 'exam_attempts' 
-                        AND column_name = 'generated_exam_id'
-                    ) THEN
-                        ALTER TABLE exam_attempts 
-                        ADD COLUMN generated_exam_id INTEGER REFERENCES generated_exams(id);
-                    END IF;
-                END $$;
-            """))
-            
-            # 4. Add new statistics columns to exam_attempts if they don't exist
-            print("Adding statistics columns to exam_attempts...")
-            
-            # total_questions
-            conn.execute(text("""
-                DO $$ 
-                BEGIN
-                    IF NOT EXISTS (
-                        SELECT 1 FROM information_schema.columns 
-                        WHERE table_name = 'exam_attempts' 
-                        AND column_name = 'total_questions'
-                    ) THEN
-                        ALTER TABLE exam_attempts 
-                        ADD COLUMN total_questions INTEGER NOT NULL DEFAULT 0;
-                    END IF;
-                END $$;
-            """))
-            
-            # correct_answers
-            conn.execute(text("""
-                DO $$ 
-                BEGIN
-                    IF NOT EXISTS (
-                        SELECT 1 FROM information_schema.columns 
-                        WHERE table_name = 'exam_attempts' 
-                        AND column_name = 'correct_answers'
-                    ) THEN
-                        ALTER TABLE exam_attempts 
-                        ADD COLUMN correct_answers INTEGER NOT NULL DEFAULT 0;
-                    END IF;
-                END $$;
-            """))
-            
-            # wrong_answers
-            conn.execute(text("""
-                DO $$ 
-                BEGIN
-                    IF NOT EXISTS (
-                        SELECT 1 FROM information_schema.columns 
-                        WHERE table_name = 'exam_attempts' 
-                        AND column_name = 'wrong_answers'
-                    ) THEN
-                        ALTER TABLE exam_attempts 
-                        ADD COLUMN wrong_answers INTEGER NOT NULL DEFAULT 0;
-                    END IF;
-                END $$;
-            """))
-            
-            # unanswered
-            conn.execute(text("""
-                DO $$ 
-                BEGIN
-                    IF NOT EXISTS (
-                        SELECT 1 FROM information_schema.columns 
-                        WHERE table_name = 'exam_attempts' 
-                        AND column_name = 'unanswered'
-                    ) THEN
-                        ALTER TABLE exam_attempts 
-                        ADD COLUMN unanswered INTEGER NOT NULL DEFAULT 0;
-                    END IF;
-                END $$;
-            """))
-            
-            # percentage
+
+            # Flags exams stored with failed questions so crud.get_cached_exam_data skips them
+            print("Adding is_complete to generated_exams...")
+            conn.execute(text("ALTER TABLE generated_exams ADD COLUMN IF NOT EXISTS is_complete BOOLEAN NOT NULL DEFAULT TRUE"))
             conn.execute(text("""
-                DO $$ 
-                BEGIN
-                    IF NOT EXISTS (
-                        SELECT 1 FROM information_schema.columns 
-                        WHERE table_name = 'exam_attempts' 
-                        AND column_name = 'percentage'
-                    ) THEN
-                        ALTER TABLE exam_attempts 
-                        ADD COLUMN percentage INTEGER;
-                    END IF;
-                END $$;
+                UPDATE generated_exams SET is_complete = FALSE
+                WHERE is_complete
+                  AND (exam_data::jsonb ? 'error'
+                       OR jsonb_array_length(COALESCE(exam_data::jsonb -> 'errors', '[]'::jsonb)) > 0);
             """))
             
-            # time_taken
+            # 2. Add generated_exam_id and the statistics columns to exam_attempts.
+            # A single ALTER TABLE takes the table lock once and updates the catalog once.
+            print("Adding generated_exam_id and statistics columns to exam_attempts...")
             conn.execute(text("""
-                DO $$ 
-                BEGIN
-                    IF NOT EXISTS (
-                        SELECT 1 FROM information_schema.columns 
-                        WHERE table_name = 'exam_attempts' 
-                        AND column_name = 'time_taken'
-                    ) THEN
-                        ALTER TABLE exam_attempts 
-                        ADD COLUMN time_taken INTEGER;
-                    END IF;
-                END $$;
+                ALTER TABLE exam_attempts
+                    ADD COLUMN IF NOT EXISTS generated_exam_id INTEGER REFERENCES generated_exams(id),
+                    ADD COLUMN IF NOT EXISTS total_questions INTEGER NOT NULL DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS correct_answers INTEGER NOT NULL DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS wrong_answers INTEGER NOT NULL DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS unanswered INTEGER NOT NULL DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS percentage INTEGER,
+                    ADD COLUMN IF NOT EXISTS time_taken INTEGER;
             """))
-            
-            trans.commit()
-            print("\n" + "="*60)
-            print("Migration completed successfully!")
-            print("="*60)
-            
-        except Exception as e:
-            trans.rollback()
-            print(f"\nERROR: Migration failed: {e}")
-            raise
+    except Exception as e:
+        print(f"\nERROR: Migration failed: {e}")
+        raise
+    
+    # 3. Create indexes without blocking writes
+    for name, definition in CONCURRENT_INDEXES.items():
+        print(f"Creating index {name}...")
+        create_index_concurrently(name, definition)
+    
+    # ix_exam_attempts_user_submitted_id leads with user_id and extends the older
+    # (user_id, submitted_at) index, so both of those are redundant
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name in REDUNDANT_INDEXES:
+            print(f"Dropping redundant index {name}...")
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    
+    print("\n" + "="*60)
+    print("Migration completed successfully!")
+    print("="*60)
 
 if __name__ == "__main__":
     run_migration()
@@ -0,0 +1,24 @@
+"""
+Migration script to add the full_name column to the users table.
+This used to run on every API start-up; it only needs to run once per database.
+"""
+from sqlalchemy import text
+from fastapi_app.database import engine
+
+def run_migration():
+    print("Starting database migration to add full_name column...")
+    
+    try:
+        with engine.begin() as conn:
+            print("Adding full_name column to users...")
+            conn.execute(text("ALTER TABLE IF EXISTS users ADD COLUMN IF NOT EXISTS full_name VARCHAR"))
+    except Exception as e:
+        print(f"\nERROR: Migration failed: {e}")
+        raise
+    
+    print("\n" + "="*60)
+    print("Migration completed successfully!")
+    print("="*60)
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,34 @@
+"""
+Migration script to store exam_data as JSONB instead of JSON text.
+JSONB is kept in a parsed binary form, so reads don't re-parse the document.
+"""
+from sqlalchemy import text
+from fastapi_app.database import engine
+
+def run_migration():
+    print("Starting database migration to convert exam_data to JSONB...")
+    
+    try:
+        with engine.begin() as conn:
+            # The cast is a no-op for columns that are already JSONB, so the script is safe to re-run.
+            print("Converting generated_exams.exam_data...")
+            conn.execute(text("""
+                ALTER TABLE generated_exams
+                ALTER COLUMN exam_data TYPE JSONB USING exam_data::jsonb;
+            """))
+
+            print("Converting exam_attempts.exam_data...")
+            conn.execute(text("""
+                ALTER TABLE exam_attempts
+                ALTER COLUMN exam_data TYPE JSONB USING exam_data::jsonb;
+            """))
+    except Exception as e:
+        print(f"\nERROR: Migration failed: {e}")
+        raise
+    
+    print("\n" + "="*60)
+    print("Migration completed successfully!")
+    print("="*60)
+
+if __name__ == "__main__":
+    run_migration()
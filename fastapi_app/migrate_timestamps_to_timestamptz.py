@@ -0,0 +1,48 @@
+"""
+Migration script to store exam timestamps as TIMESTAMPTZ with a database-side default,
+and subscription expiry times as TIMESTAMPTZ.
+Existing exam timestamps were written with datetime.utcnow(), so they are interpreted as UTC.
+Subscription expiry times were written with the API host's local time, which is assumed
+to be UTC.
+"""
+from sqlalchemy import text
+from fastapi_app.database import engine
+
+def run_migration():
+    print("Starting database migration to convert timestamps to TIMESTAMPTZ...")
+    
+    try:
+        with engine.begin() as conn:
+            # With the session in UTC the conversion is a no-op for columns that are already TIMESTAMPTZ,
+            # so the script is safe to re-run.
+            conn.execute(text("SET LOCAL TIME ZONE 'UTC'"))
+
+            print("Converting exam_attempts.submitted_at...")
+            conn.execute(text("""
+                ALTER TABLE exam_attempts
+                ALTER COLUMN submitted_at TYPE TIMESTAMPTZ USING submitted_at AT TIME ZONE 'UTC',
+                ALTER COLUMN submitted_at SET DEFAULT NOW();
+            """))
+
+            print("Converting generated_exams.generated_at...")
+            conn.execute(text("""
+                ALTER TABLE generated_exams
+                ALTER COLUMN generated_at TYPE TIMESTAMPTZ USING generated_at AT TIME ZONE 'UTC',
+                ALTER COLUMN generated_at SET DEFAULT NOW();
+            """))
+
+            print("Converting subscriptions.expires_at...")
+            conn.execute(text("""
+                ALTER TABLE subscriptions
+                ALTER COLUMN expires_at TYPE TIMESTAMPTZ USING expires_at AT TIME ZONE 'UTC';
+            """))
+    except Exception as e:
+        print(f"\nERROR: Migration failed: {e}")
+        raise
+    
+    print("\n" + "="*60)
+    print("Migration completed successfully!")
+    print("="*60)
+
+if __name__ == "__main__":
+    run_migration()
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Enum as SQLAlchemyEnum, JSON
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index, DDL, event, Enum as SQLAlchemyEnum
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func, true
 from .database import Base
-import datetime
 import enum
 
 # Define an Enum for user roles to ensure data consistency
@@ -29,6 +30,36 @@ class User(Base):
     generated_exams = relationship("GeneratedExam", back_populates="user", cascade="all, delete-orphan")
     exam_attempts = relationship("ExamAttempt", back_populates="user", cascade="all, delete-orphan")
 
+# The API workers cache users and subscriptions in process. These triggers NOTIFY the
+# AUTH_CACHE_CHANNEL with the user's id after any write to a cached field, including writes
+# made outside the API (psql, admin tools), and cache_invalidation evicts that user everywhere.
+AUTH_CACHE_CHANNEL = "auth_cache"
+
+def auth_cache_trigger_sql(table: str, user_id_column: str, events: str) -> list[str]:
+    """Statements that (re)create the notify_auth_cache trigger on a table."""
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION notify_auth_cache() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify(
+                '{AUTH_CACHE_CHANNEL}',
+                (CASE WHEN TG_OP = 'DELETE' THEN to_jsonb(OLD) ELSE to_jsonb(NEW) END) ->> TG_ARGV[0]
+            );
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        f"DROP TRIGGER IF EXISTS {table}_notify_auth_cache ON {table}",
+        f"CREATE TRIGGER {table}_notify_auth_cache AFTER {events} ON {table} "
+        f"FOR EACH ROW EXECUTE FUNCTION notify_auth_cache('{user_id_column}')",
+    ]
+
+USERS_AUTH_CACHE_TRIGGER_SQL = auth_cache_trigger_sql(
+    "users", "id", "UPDATE OF email, full_name, hashed_password, role, is_active OR DELETE"
+)
+for _statement in USERS_AUTH_CACHE_TRIGGER_SQL:
+    event.listen(User.__table__, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+
 class Subscription(Base):
     """
     SQLAlchemy model for the 'subscriptions' table.
@@ -40,10 +71,16 @@ class Subscription(Base):
     user_id = Column(Integer, ForeignKey("users.id"), unique=True, nullable=False)
     payment_customer_id = Column(String, unique=True, index=True, nullable=True)
     is_active = Column(Boolean, default=False)
-    expires_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=True)
     
     user = relationship("User", back_populates="subscription")
 
+SUBSCRIPTIONS_AUTH_CACHE_TRIGGER_SQL = auth_cache_trigger_sql(
+    "subscriptions", "user_id", "INSERT OR UPDATE OR DELETE"
+)
+for _statement in SUBSCRIPTIONS_AUTH_CACHE_TRIGGER_SQL:
+    event.listen(Subscription.__table__, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+
 class GeneratedExam(Base):
     """
     Stores exams generated by users that haven't been attempted yet.
@@ -57,12 +94,24 @@ class GeneratedExam(Base):
     exam_name = Column(String, nullable=False)
     stream = Column(String, nullable=True)
     year = Column(Integer, nullable=True)
-    generated_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
-    exam_data = Column(JSON, nullable=False)  # Full exam structure
+    generated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    exam_data = Column(JSONB, nullable=False)  # Full exam structure
     is_attempted = Column(Boolean, default=False)
+    # False when some questions failed to generate; such exams are never reused for other users
+    is_complete = Column(Boolean, nullable=False, default=True, server_default=true())
 
     user = relationship("User", back_populates="generated_exams")
 
+    # Serves the generated-exam reuse lookup in crud.get_cached_exam_data
+    __table_args__ = (
+        Index(
+            "ix_generated_exams_lookup",
+            func.upper(exam_type),
+            func.upper(func.coalesce(stream, "")),
+            year,
+        ),
+    )
+
 class ExamAttempt(Base):
     """
     Stores historical exam submissions for users with detailed statistics.
@@ -70,7 +119,8 @@ class ExamAttempt(Base):
     __tablename__ = "exam_attempts"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    # Indexed through the leading column of ix_exam_attempts_user_submitted_id
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     generated_exam_id = Column(Integer, ForeignKey("generated_exams.id"), nullable=True)
     exam_type = Column(String, nullable=False)  # CAT or GATE
     exam_name = Column(String, nullable=False)
@@ -83,9 +133,14 @@ class ExamAttempt(Base):
     unanswered = Column(Integer, nullable=False)
     percentage = Column(Integer, nullable=True)
     time_taken = Column(Integer, nullable=True)  # in seconds
-    submitted_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
-    exam_data = Column(JSON, nullable=False)
+    submitted_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    exam_data = Column(JSONB, nullable=False)
 
     user = relationship("User", back_populates="exam_attempts")
     generated_exam = relationship("GeneratedExam")
 
+    # Serves the per-user history listing (newest first) as an index range scan
+    __table_args__ = (
+        Index("ix_exam_attempts_user_submitted_id", user_id, submitted_at.desc(), id.desc()),
+    )
+
@@ -1,7 +1,7 @@
 import razorpay
 from fastapi import APIRouter, Depends, HTTPException, Request, Header
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import hmac
 import hashlib
 
@@ -97,7 +97,7 @@ async def razorpay_webhook(request: Request, x_razorpay_signature: str = Header(
                 user_id = int(user_id)
                 
                 # For simplicity, we'll set the expiration to 31 days from now.
-                expires_at = datetime.now() + timedelta(days=31)
+                expires_at = datetime.now(timezone.utc) + timedelta(days=31)
 
                 crud.create_or_update_subscription(
                     db=db,
@@ -1,19 +1,40 @@
 import chromadb
 from sentence_transformers import SentenceTransformer
-import json
+import orjson
 import os
 import random
 import asyncio
+import itertools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
 import google.generativeai as genai
-import requests
-from datetime import datetime
+import aiohttp
 
 # --- Configuration ---
+# Start-up diagnostics are only printed with RAG_VERBOSE set
+RAG_VERBOSE = bool(os.environ.get("RAG_VERBOSE"))
+logger = logging.getLogger("rag")
+logger.setLevel(logging.DEBUG if RAG_VERBOSE else logging.WARNING)
+if RAG_VERBOSE and not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+
 BASE_APP_DATA_PATH = './app_data'
 MODEL_NAME = 'all-MiniLM-L6-v2'
 LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "ollama") # 'gemini' or 'ollama'
 OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
 OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "granite4:3b-h")
+# Opt-in int8 dynamic quantization of the embedding model's Linear layers (CPU only)
+QUANTIZE_EMBEDDINGS = os.environ.get("RAG_QUANTIZE_EMBEDDINGS", "0") == "1"
+# Maximum number of LLM calls in flight per service, which keeps providers within rate limits
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "8"))
+# Threads available for blocking Gemini calls, shared by every RAGService
+GEMINI_CONCURRENCY = int(os.environ.get("GEMINI_CONCURRENCY", "8"))
+GEMINI_EXECUTOR = ThreadPoolExecutor(max_workers=GEMINI_CONCURRENCY, thread_name_prefix="gemini")
+OLLAMA_TIMEOUT_SECONDS = 300
+# Upper bound on pooled keep-alive connections to the Ollama server
+OLLAMA_MAX_CONNECTIONS = 32
 
 def get_exam_paths(exam_type):
     """Get paths for vector DB, questions, and generated exams based on exam type"""
@@ -56,113 +77,239 @@ SECTION_FILENAME_MAP = {
     "technical": "TECH"
 }
 
+# Resolved abbreviation for every supported section
+SECTION_ABBRS = {
+    section: SECTION_FILENAME_MAP.get(section, section.upper())
+    for structure in SUPPORTED_EXAMS.values()
+    for section in structure
+}
+
+# Per exam, one (section, q_type, type label) entry for each question to generate
+QUESTION_PLANS = {
+    exam: tuple(
+        (section, q_type, q_type.upper())
+        for section, structure in sections.items()
+        for q_type, count in structure.items()
+        for _ in range(count)
+    )
+    for exam, sections in SUPPORTED_EXAMS.items()
+}
+
+# Exam names used in the LLM prompt
+EXAM_DISPLAY_NAMES = {
+    "CAT": "CAT (Common Admission Test)",
+    "GATE": "GATE (Graduate Aptitude Test in Engineering)"
+}
+
+_QUESTION_TYPE_INSTRUCTIONS = {
+    "mcq": "an MCQ (Multiple Choice Question) with 4 options labeled 'option1' to 'option4'",
+    "tita": "a TITA (Type In The Answer) question where the answer is a numerical value or short text"
+}
+
+# Static prompt text around the retrieved example questions
+_PROMPT_HEAD = """
+You are an expert question setter for the {exam} exam.
+Your task is to generate a new, original question for the '{section}' section.
+The question must be of type: {question_type}.
+It should be of a similar style, topic, and difficulty level to the following examples:
+---
+"""
+
+_PROMPT_TAIL = """
+---
+Your entire response MUST be a single, valid JSON object. Do not include any other text, markdown, or explanation.
+The JSON object must have the following structure:
+- For MCQ: {"question_text": "...", "option1": "...", "option2": "...", "option3": "...", "option4": "...", "answer": "The correct option text", "explanation": "A brief explanation."}
+- For TITA: {"question_text": "...", "answer": "The numerical or short text answer", "explanation": "A brief explanation."}
+"""
+
+# Placeholder for a filter that was not requested in seed index keys
+SEED_ANY = "*"
+
+# Process-wide embedding model and ChromaDB clients (one per vector DB path),
+# shared by every RAGService so they are only loaded once per worker
+_MODEL_SINGLETON = None
+_CHROMA_CLIENTS = {}
+_SHARED_RESOURCES_LOCK = threading.Lock()
+
+def _quantize_model(model):
+    """
+    Swaps the transformer's Linear layers for int8 dynamically quantized ones, which
+    roughly doubles CPU embedding throughput. Query embeddings drift slightly from the
+    FP32 vectors stored in the DB, so this is off unless RAG_QUANTIZE_EMBEDDINGS=1.
+    """
+    try:
+        import torch
+        transformer = model[0]
+        transformer.auto_model = torch.ao.quantization.quantize_dynamic(
+            transformer.auto_model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        logger.debug("Embedding model quantized to int8.")
+    except Exception as e:
+        logger.warning(f"Could not quantize embedding model, using FP32: {e}")
+
+def get_embedding_model():
+    """Returns the shared sentence transformer, loading it on first use."""
+    global _MODEL_SINGLETON
+    with _SHARED_RESOURCES_LOCK:
+        if _MODEL_SINGLETON is None:
+            logger.debug(f"Loading sentence transformer model: {MODEL_NAME}")
+            model = SentenceTransformer(MODEL_NAME)
+            if QUANTIZE_EMBEDDINGS:
+                _quantize_model(model)
+            _MODEL_SINGLETON = model
+        return _MODEL_SINGLETON
+
+def get_chroma_client(path):
+    """Returns the shared ChromaDB client for a vector DB path, creating it on first use."""
+    with _SHARED_RESOURCES_LOCK:
+        client = _CHROMA_CLIENTS.get(path)
+        if client is None:
+            client = chromadb.PersistentClient(path=path)
+            _CHROMA_CLIENTS[path] = client
+        return client
+
 class RAGService:
     def __init__(self, exam_type="CAT"):
         self.exam_type = exam_type.upper()
         self.paths = get_exam_paths(self.exam_type)
         
-        print(f"Initializing RAG Service for {self.exam_type} exam...")
-        print(f"Loading vector database from: {self.paths['vector_db']}")
+        logger.debug(f"Initializing RAG Service for {self.exam_type} exam...")
+        logger.debug(f"Loading vector database from: {self.paths['vector_db']}")
         
         # Ensure directories exist
         os.makedirs(self.paths['vector_db'], exist_ok=True)
         os.makedirs(self.paths['structured_questions'], exist_ok=True)
-        os.makedirs(self.paths['generated_exams'], exist_ok=True)
         
-        self.client = chromadb.PersistentClient(path=self.paths['vector_db'])
+        self.client = get_chroma_client(self.paths['vector_db'])
+        # Collection handles by name, so metadata is fetched once per collection
+        self._collection_cache = {}
 
-        # Diagnostic check for existing collections
-        print("\n--- Vector DB Collection Summary ---")
-        try:
-            collections = self.client.list_collections()
-            if collections:
-                print(f"Found {len(collections)} collections: {[c.name for c in collections]}")
-            else:
-                print("No collections found. Please run 'build_vector_db.py' to create them.")
-        except Exception as e:
-            print(f"Could not connect to or list collections in ChromaDB: {e}")
-            print("Please ensure the vector database has been built correctly.")
-        print("------------------------------------\n")
+        if RAG_VERBOSE:
+            self._log_collection_summary()
 
-        print(f"Loading sentence transformer model: {MODEL_NAME}")
-        self.model = SentenceTransformer(MODEL_NAME)
+        self.model = get_embedding_model()
 
         self.source_questions = self._load_source_questions()
 
+        self._prompt_heads = self._build_prompt_heads()
+        self._llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+        # Pooled HTTP session for Ollama, created lazily on the running event loop
+        self._ollama_session = None
+
         # Gemini model attributes (lazy initialization)
         self._gemini_model = None
         self._gemini_model_name = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
 
-        # Diagnostic summary to check loaded data
-        print("\n--- Source Data Summary ---")
-        for section, questions in self.source_questions.items():
-            if not questions:
-                print(f"Section {section.upper()}: 0 questions loaded. Please check the source JSON file.")
-                continue
-            mcq_count = sum(1 for q in questions if 'option1' in q)
-            tita_count = sum(1 for q in questions if 'option1' not in q)
-            print(f"Section {section.upper()}: Loaded {len(questions)} total questions ({mcq_count} MCQ, {tita_count} TITA).")
-        print("---------------------------\n")
+        self._log_source_summary()
 
-        print("RAG Service initialized successfully.")
+        logger.debug("RAG Service initialized successfully.")
+
+    def _log_collection_summary(self):
+        """Diagnostic check for existing collections."""
+        logger.debug("\n--- Vector DB Collection Summary ---")
+        try:
+            collections = self.client.list_collections()
+            if collections:
+                logger.debug(f"Found {len(collections)} collections: {[c.name for c in collections]}")
+            else:
+                logger.debug("No collections found. Please run 'build_vector_db.py' to create them.")
+        except Exception as e:
+            logger.debug(f"Could not connect to or list collections in ChromaDB: {e}")
+            logger.debug("Please ensure the vector database has been built correctly.")
+        logger.debug("------------------------------------\n")
+
+    def _log_source_summary(self):
+        """Diagnostic summary to check loaded data. Counts come from the type buckets, so this is O(sections)."""
+        logger.debug("\n--- Source Data Summary ---")
+        for section, buckets in self.source_questions.items():
+            mcq_count = len(buckets['mcq'])
+            tita_count = len(buckets['tita'])
+            if not mcq_count and not tita_count:
+                # Always reported, an empty bank means seeds can't be found for this section
+                logger.warning(f"Section {section.upper()}: 0 questions loaded. Please check the source JSON file.")
+                continue
+            logger.debug(f"Section {section.upper()}: Loaded {mcq_count + tita_count} total questions ({mcq_count} MCQ, {tita_count} TITA).")
+        logger.debug("---------------------------\n")
 
     def _load_source_questions(self):
         """
         Loads all questions from the JSON files into memory for quick lookups.
-        Handles both CAT and GATE exam formats.
+        Handles both CAT and GATE exam formats. Each section's questions are split
+        into 'mcq' and 'tita' lists once here, so nothing downstream re-checks the type.
+        Section files are read in parallel so disk I/O of one overlaps parsing of another.
         """
-        source_data = {}
-        exam_sections = SUPPORTED_EXAMS.get(self.exam_type, {}).keys()
-        
-        for section in exam_sections:
-            file_abbr = SECTION_FILENAME_MAP.get(section, section.upper())
-            file_name = f"{self.exam_type}_{file_abbr}_all_years_combined.json"
-            file_path = os.path.join(self.paths['structured_questions'], file_name)
-            
-            if os.path.exists(file_path):
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        source_data[section] = data if isinstance(data, list) else []
-                except json.JSONDecodeError:
-                    print(f"Warning: Could not decode JSON from {file_path}.")
-                    source_data[section] = []
-            else:
-                source_data[section] = []
-                print(f"Warning: Source JSON file not found at '{file_path}'")
+        exam_sections = list(SUPPORTED_EXAMS.get(self.exam_type, {}).keys())
+        if not exam_sections:
+            self._seed_index = {}
+            return {}
+
+        with ThreadPoolExecutor(max_workers=len(exam_sections), thread_name_prefix="source-load") as executor:
+            source_data = dict(zip(exam_sections, executor.map(self._load_section_questions, exam_sections)))
+
+        self._seed_index = {section: self._build_seed_index(buckets) for section, buckets in source_data.items()}
         return source_data
 
+    def _load_section_questions(self, section):
+        """Reads one section's question bank and buckets it by question type."""
+        file_abbr = SECTION_ABBRS[section]
+        file_name = f"{self.exam_type}_{file_abbr}_all_years_combined.json"
+        file_path = os.path.join(self.paths['structured_questions'], file_name)
+
+        questions = []
+        if os.path.exists(file_path):
+            try:
+                # orjson parses the raw UTF-8 bytes directly, without a str decode
+                with open(file_path, 'rb') as f:
+                    data = orjson.loads(f.read())
+                    questions = data if isinstance(data, list) else []
+            except orjson.JSONDecodeError:
+                logger.warning(f"Could not decode JSON from {file_path}.")
+        else:
+            logger.warning(f"Source JSON file not found at '{file_path}'")
+
+        buckets = {'mcq': [], 'tita': []}
+        for q in questions:
+            buckets['mcq' if 'option1' in q else 'tita'].append(q)
+        return buckets
+
+    @staticmethod
+    def _build_seed_index(buckets):
+        """
+        Groups a section's questions by every (exam, stream, year, type) filter combination,
+        with SEED_ANY standing in for an unused filter, so a seed lookup is a single dict access.
+        """
+        index = defaultdict(list)
+        for q_type, questions in buckets.items():
+            for q in questions:
+                exam_keys = ((q.get('exam') or '').lower(), SEED_ANY)
+                stream_keys = ((q.get('stream') or '').lower(), SEED_ANY)
+                year_keys = (q.get('year'), SEED_ANY)
+                for exam_key, stream_key, year_key in itertools.product(exam_keys, stream_keys, year_keys):
+                    index[(exam_key, stream_key, year_key, q_type)].append(q)
+        return index
+
     def _find_seed_question(self, section, q_type, exam_name, stream, year):
         """Finds a random question that matches the specified filters to seed the search."""
-        candidates = self.source_questions.get(section, [])
-        
-        # Filter by exam first
-        if exam_name:
-            candidates = [q for q in candidates if q.get('exam', '').lower() == exam_name.lower()]
-        
+        stream_key = SEED_ANY
         # For GATE, handle GA vs Technical sections differently
         if exam_name and exam_name.upper() == "GATE":
-            if section == "general_aptitude":
-                # GA questions are shared across all streams, don't filter by stream
-                pass
-            elif section == "technical" and stream:
-                # Technical questions are stream-specific
-                candidates = [q for q in candidates if q.get('stream', '').lower() == stream.lower()]
+            # GA questions are shared across all streams, technical questions are stream-specific
+            if section == "technical" and stream:
+                stream_key = stream.lower()
         elif stream:
             # For other exams, filter by stream if provided
-            candidates = [q for q in candidates if q.get('stream', '').lower() == stream.lower()]
-            
-        # Filter by year if provided
-        if year:
-            candidates = [q for q in candidates if q.get('year') == year]
-
-        # Filter by question type
-        if q_type == 'mcq':
-            filtered = [q for q in candidates if 'option1' in q]
-        else: # TITA
-            filtered = [q for q in candidates if 'option1' not in q]
+            stream_key = stream.lower()
 
-        return random.choice(filtered) if filtered else None
+        key = (
+            exam_name.lower() if exam_name else SEED_ANY,
+            stream_key,
+            year if year else SEED_ANY,
+            'mcq' if q_type == 'mcq' else 'tita',
+        )
+        candidates = self._seed_index.get(section, {}).get(key)
+        return random.choice(candidates) if candidates else None
 
     def _ensure_gemini_model(self):
         """
@@ -174,7 +321,7 @@ class RAGService:
 
         gemini_api_key = os.environ.get("GEMINI_API_KEY")
         if not gemini_api_key:
-            print("Warning: GEMINI_API_KEY not set. Gemini generation is unavailable.")
+            logger.warning("GEMINI_API_KEY not set. Gemini generation is unavailable.")
             return None
 
         model_name = os.environ.get("GEMINI_MODEL", self._gemini_model_name)
@@ -184,7 +331,7 @@ class RAGService:
             self._gemini_model_name = model_name
             return self._gemini_model
         except Exception as exc:
-            print(f"Error initializing Gemini model '{model_name}': {exc}")
+            logger.error(f"Error initializing Gemini model '{model_name}': {exc}")
             return None
 
     @staticmethod
@@ -210,74 +357,106 @@ class RAGService:
 
         return "\n".join(parts).strip()
 
-    async def _generate_single_question(self, section, q_type, exam_name, stream, year):
-        """Generates one new question using the RAG pipeline with Gemini API."""
-        seed_question = self._find_seed_question(section, q_type, exam_name, stream, year)
-        if not seed_question:
-            return {"error": f"No seed questions found for {exam_name} {stream or ''} {year or ''} - {section} {q_type}"}
-
+    def _collection_name(self, section, stream):
+        """Returns the vector DB collection holding the given section's questions."""
         # Handle collection naming for both CAT and GATE
         if self.exam_type == "CAT":
             collection_abbr = 'qa' if section == 'quant' else section
-            collection_name = f"cat_{collection_abbr}_all_years_combined"
-        else:  # GATE
-            if section == "technical":
-                # For GATE technical questions, use stream-specific collection
-                collection_name = f"gate_{stream.lower()}_technical_all_years_combined"
-            else:  # general_aptitude
-                collection_name = f"gate_ga_all_years_combined"
+            return f"cat_{collection_abbr}_all_years_combined"
+        if section == "technical":
+            # For GATE technical questions, use stream-specific collection
+            return f"gate_{stream.lower()}_technical_all_years_combined"
+        return "gate_ga_all_years_combined"
 
-        try:
+    def _encode_seed_questions(self, seed_questions):
+        """
+        Embeds all seed question texts in one batched forward pass, using the same
+        model and settings the vector DB was built with.
+        """
+        texts = [seed['question_text'] for seed in seed_questions]
+        return self.model.encode(texts, batch_size=32, convert_to_numpy=True)
+
+    def _get_collection(self, collection_name):
+        """Returns the cached handle for a collection, fetching it on first use."""
+        collection = self._collection_cache.get(collection_name)
+        if collection is None:
+            # Raises if the collection doesn't exist, so missing ones are never cached
             collection = self.client.get_collection(name=collection_name)
-            retrieved_results = collection.query(
-                query_texts=[seed_question['question_text']],
-                n_results=3 
+            self._collection_cache[collection_name] = collection
+        return collection
+
+    def _retrieve_context(self, collection_name, seed_embedding):
+        """Fetches the stored questions closest to the seed embedding."""
+        collection = self._get_collection(collection_name)
+        retrieved_results = collection.query(
+            query_embeddings=[seed_embedding.tolist()],
+            n_results=3 
+        )
+        return retrieved_results['documents'][0]
+
+    async def _invoke_llm(self, prompt):
+        """
+        Sends the prompt to the configured LLM provider.
+        Returns the raw response text, or an error dict if the call failed.
+        """
+        if LLM_PROVIDER == 'ollama':
+            try:
+                return await self._invoke_ollama(prompt)
+            except Exception as e:
+                return {"error": f"Ollama API Error: {e}"}
+
+        gemini_model = self._ensure_gemini_model()
+        if not gemini_model:
+            return {"error": "Gemini API Key not found. Please set the GEMINI_API_KEY environment variable."}
+
+        generation_config = {
+            "temperature": 0.7,
+            "max_output_tokens": 4096,
+            "response_mime_type": "application/json"
+        }
+
+        def _invoke_gemini():
+            return gemini_model.generate_content(
+                prompt,
+                generation_config=generation_config
             )
-            
-            context_questions = retrieved_results['documents'][0]
-            prompt = self._create_llm_prompt(section, q_type, context_questions)
-            
-            if LLM_PROVIDER == 'ollama':
-                try:
-                    response_text = await self._invoke_ollama(prompt)
-                    llm_text = response_text
-                except Exception as e:
-                    return {"error": f"Ollama API Error: {e}"}
+
+        try:
+            # Prefer the SDK's native async call; otherwise run the blocking one on the bounded pool
+            generate_content_async = getattr(gemini_model, "generate_content_async", None)
+            if generate_content_async:
+                response = await generate_content_async(prompt, generation_config=generation_config)
             else:
-                gemini_model = self._ensure_gemini_model()
-                if not gemini_model:
-                    return {"error": "Gemini API Key not found. Please set the GEMINI_API_KEY environment variable."}
-
-                generation_config = {
-                    "temperature": 0.7,
-                    "max_output_tokens": 4096,
-                    "response_mime_type": "application/json"
-                }
-
-                def _invoke_gemini():
-                    return gemini_model.generate_content(
-                        prompt,
-                        generation_config=generation_config
-                    )
-
-                try:
-                    response = await asyncio.to_thread(_invoke_gemini)
-                    llm_text = self._extract_gemini_text(response) or "{}"
-                except Exception as exc:
-                    return {"error": f"Gemini API Error: {exc}"}
+                response = await asyncio.get_running_loop().run_in_executor(GEMINI_EXECUTOR, _invoke_gemini)
+            return self._extract_gemini_text(response) or "{}"
+        except Exception as exc:
+            return {"error": f"Gemini API Error: {exc}"}
+
+    async def _generate_single_question(self, section, q_type, q_label, stream, seed_embedding):
+        """Generates one new question from a pre-embedded seed using the RAG pipeline."""
+        collection_name = self._collection_name(section, stream)
+
+        try:
+            context_questions = self._retrieve_context(collection_name, seed_embedding)
+            prompt = self._create_llm_prompt(section, q_type, context_questions)
+
+            async with self._llm_semaphore:
+                llm_text = await self._invoke_llm(prompt)
+            if isinstance(llm_text, dict):
+                return llm_text
 
             try:
-                # Clean up potential markdown code blocks from Ollama
-                if "```json" in llm_text:
-                    llm_text = llm_text.split("```json")[1].split("```")[0].strip()
-                elif "```" in llm_text:
-                    llm_text = llm_text.split("```")[1].split("```")[0].strip()
+                # Slice out the outermost JSON object, which also drops any markdown fences from Ollama
+                start = llm_text.find('{')
+                end = llm_text.rfind('}') + 1
+                if start != -1 and end > start:
+                    llm_text = llm_text[start:end]
                 
-                generated_q = json.loads(llm_text)
-                generated_q['section'] = SECTION_FILENAME_MAP.get(section, section.upper())
-                generated_q['type'] = q_type.upper()
+                generated_q = orjson.loads(llm_text)
+                generated_q['section'] = SECTION_ABBRS[section]
+                generated_q['type'] = q_label
                 return generated_q
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 return {"error": "Failed to parse LLM JSON response", "raw_response": llm_text}
 
         except ValueError as e:
@@ -287,102 +466,63 @@ class RAGService:
         except Exception as e:
             return {"error": f"An unexpected exception occurred: {str(e)}"}
 
+    def _ensure_ollama_session(self):
+        """
+        Lazily create the aiohttp session used for all Ollama calls so connections
+        are reused across questions instead of opened per request.
+        """
+        if self._ollama_session is None or self._ollama_session.closed:
+            self._ollama_session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=OLLAMA_TIMEOUT_SECONDS),
+                connector=aiohttp.TCPConnector(limit=OLLAMA_MAX_CONNECTIONS),
+            )
+        return self._ollama_session
+
     async def _invoke_ollama(self, prompt):
         """Invokes the Ollama API to generate content."""
-        url = f"{OLLAMA_BASE_URL}/api/generate"
         payload = {
             "model": OLLAMA_MODEL,
             "prompt": prompt,
             "stream": False,
             "format": "json"
         }
-        
-        def _post_request():
-            response = requests.post(url, json=payload)
-            response.raise_for_status()
-            return response.json()
 
-        response_json = await asyncio.to_thread(_post_request)
+        session = self._ensure_ollama_session()
+        async with session.post(f"{OLLAMA_BASE_URL.rstrip('/')}/api/generate", json=payload) as response:
+            response.raise_for_status()
+            response_json = await response.json(loads=orjson.loads)
         return response_json.get("response", "")
 
+    async def close(self):
+        """Releases the pooled Ollama connections."""
+        if self._ollama_session is not None:
+            await self._ollama_session.close()
+            self._ollama_session = None
+
+    def _build_prompt_heads(self):
+        """Formats the static part of the prompt once per (section, question type)."""
+        exam_display_name = EXAM_DISPLAY_NAMES.get(self.exam_type, self.exam_type)
+        return {
+            (section, q_type): _PROMPT_HEAD.format(
+                exam=exam_display_name,
+                section=SECTION_ABBRS[section],
+                question_type=instruction,
+            )
+            for section in SUPPORTED_EXAMS.get(self.exam_type, {})
+            for q_type, instruction in _QUESTION_TYPE_INSTRUCTIONS.items()
+        }
+
     def _create_llm_prompt(self, section, q_type, context_questions):
         """Constructs the prompt with instructions and context."""
-        question_type_instruction = (
-            "an MCQ (Multiple Choice Question) with 4 options labeled 'option1' to 'option4'" if q_type == 'mcq'
-            else "a TITA (Type In The Answer) question where the answer is a numerical value or short text"
-        )
-        
-        context_str = "\n---\n".join(context_questions)
-
-        prompt = f"""
-        You are an expert question setter for the CAT (Common Admission Test) exam.
-        Your task is to generate a new, original question for the '{SECTION_FILENAME_MAP.get(section, section.upper())}' section.
-        The question must be of type: {question_type_instruction}.
-        It should be of a similar style, topic, and difficulty level to the following examples:
-        ---
-        {context_str}
-        ---
-        Your entire response MUST be a single, valid JSON object. Do not include any other text, markdown, or explanation.
-        The JSON object must have the following structure:
-        - For MCQ: {{"question_text": "...", "option1": "...", "option2": "...", "option3": "...", "option4": "...", "answer": "The correct option text", "explanation": "A brief explanation."}}
-        - For TITA: {{"question_text": "...", "answer": "The numerical or short text answer", "explanation": "A brief explanation."}}
-        """
-        return prompt
-
-    def _generate_cache_key(self, exam_name: str, stream: str | None = None, year: int | None = None):
-        """Generate a cache key for exam lookup."""
-        key_parts = [exam_name.upper()]
-        if stream:
-            key_parts.append(stream.upper())
-        if year:
-            key_parts.append(str(year))
-        return "_".join(key_parts)
-
-    def _find_cached_exam(self, exam_name: str, stream: str | None = None, year: int | None = None):
-        """Check if a similar exam already exists in generated_questions folder."""
-        try:
-            exam_files = os.listdir(self.paths['generated_exams'])
-            cache_key = self._generate_cache_key(exam_name, stream, year)
-            
-            # Look for files that match our pattern
-            for file_name in exam_files:
-                if file_name.startswith(f"{self.exam_type.lower()}_exam") and file_name.endswith(".json"):
-                    # Load and check if it matches our requirements
-                    file_path = os.path.join(self.paths['generated_exams'], file_name)
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        exam_data = json.load(f)
-                        
-                    exam_details = exam_data.get('exam_details', {})
-                    # Normalize both values, treating None and empty string as equivalent
-                    cached_stream = (exam_details.get('stream') or '').upper()
-                    requested_stream = (stream or '').upper()
-                    
-                    # For CAT, stream might be None, so we need to handle that case
-                    if exam_details.get('name', '').upper() == exam_name.upper():
-                        # If both streams are empty/None, or they match, it's a cache hit
-                        if cached_stream == requested_stream:
-                            if year and exam_details.get('year') == year:
-                                print(f"Found cached exam: {file_name}")
-                                return exam_data
-                        
-        except Exception as e:
-            print(f"Error checking cached exams: {e}")
-        
-        return None
+        head = self._prompt_heads[(section, 'mcq' if q_type == 'mcq' else 'tita')]
+        return head + "\n---\n".join(context_questions) + _PROMPT_TAIL
 
     async def generate_full_exam(self, exam_name: str, stream: str | None = None, year: int | None = None):
         """
-        Orchestrates the generation of a full mock exam section by section
-        to respect API rate limits. Checks for cached exams first.
+        Orchestrates the generation of a full mock exam. LLM calls for all
+        sections run concurrently, bounded by LLM_CONCURRENCY. Reusing previously generated exams is
+        handled by the caller through the generated_exams table.
         """
-        # Check for cached exam first
-        cached_exam = self._find_cached_exam(exam_name, stream, year)
-        if cached_exam:
-            print("Using cached exam - no AI generation needed!")
-            return cached_exam
-            
-        print("No cached exam found, generating new exam with AI...")
-        
         exam_name_upper = exam_name.upper()
         
         # Validate GATE stream if provided
@@ -390,9 +530,9 @@ class RAGService:
             if not stream or stream.upper() not in GATE_STREAMS:
                 return {"error": f"Invalid or missing GATE stream. Must be one of: {', '.join(GATE_STREAMS)}"}
         
-        exam_structure = SUPPORTED_EXAMS.get(exam_name_upper)
+        question_plan = QUESTION_PLANS.get(exam_name_upper)
 
-        if not exam_structure:
+        if not question_plan:
             return {"error": f"Exam structure for '{exam_name_upper}' is not supported."}
 
         print(f"Generating {exam_name_upper} mock exam...")
@@ -409,64 +549,49 @@ class RAGService:
                 "GA": [], "TECH": [], "errors": []
             }
 
-        sections_to_process = list(exam_structure.keys())
-
-        for i, section in enumerate(sections_to_process):
-            print(f"\n--- Generating section: {section.upper()} ---")
-            
-            tasks = []
-            structure = exam_structure[section]
-            
-            for q_type, count in structure.items():
-                for _ in range(count):
-                    tasks.append(self._generate_single_question(section, q_type, exam_name, stream, year))
-            
-            generated_questions = await asyncio.gather(*tasks)
-
-            for q in generated_questions:
-                section_key = q.get('section')
-                if section_key and section_key in full_exam:
-                    full_exam[section_key].append(q)
-                elif "error" in q:
-                    full_exam["errors"].append(q)
-                else:
-                    full_exam["errors"].append({"error": "Generated question has unknown section", "details": q})
-
-            print(f"--- Section {section.upper()} generation complete. ---")
-
-            if i < len(sections_to_process) - 1:
-                print(f"Waiting for 1 seconds to avoid rate limiting...")
-                await asyncio.sleep(1)
+        # Pick every seed for the exam up front so they can be embedded in one batch
+        seeded = []
+        generated_questions = []
+        for section, q_type, q_label in question_plan:
+            seed_question = self._find_seed_question(section, q_type, exam_name, stream, year)
+            if seed_question:
+                seeded.append((section, q_type, q_label, seed_question))
+            else:
+                generated_questions.append({"error": f"No seed questions found for {exam_name} {stream or ''} {year or ''} - {section} {q_type}"})
+
+        if seeded:
+            embeddings = await asyncio.to_thread(self._encode_seed_questions, [seed for *_, seed in seeded])
+            # All questions are launched together; self._llm_semaphore bounds the in-flight LLM calls
+            print(f"Generating {len(seeded)} questions (max {LLM_CONCURRENCY} concurrent LLM calls)...")
+            tasks = [
+                self._generate_single_question(section, q_type, q_label, stream, embedding)
+                for (section, q_type, q_label, _), embedding in zip(seeded, embeddings)
+            ]
+            generated_questions.extend(await asyncio.gather(*tasks))
+
+        for q in generated_questions:
+            section_key = q.get('section')
+            if section_key and section_key in full_exam:
+                full_exam[section_key].append(q)
+            elif "error" in q:
+                full_exam["errors"].append(q)
+            else:
+                full_exam["errors"].append({"error": "Generated question has unknown section", "details": q})
         
         print("\nFull exam generation complete.")
-        self._save_exam(full_exam)
         return full_exam
 
-    def _save_exam(self, exam_data):
-        """Saves the generated exam to a timestamped JSON file."""
-        try:
-            os.makedirs(self.paths['generated_exams'], exist_ok=True)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            stream_suffix = f"_{exam_data['exam_details']['stream']}" if exam_data['exam_details'].get('stream') else ""
-            file_name = f"{self.exam_type.lower()}_exam{stream_suffix}_{timestamp}.json"
-            save_path = os.path.join(self.paths['generated_exams'], file_name)
-
-            with open(save_path, 'w', encoding='utf-8') as f:
-                json.dump(exam_data, f, indent=2)
-            
-            print(f"Successfully saved generated exam to: {save_path}")
-        except Exception as e:
-            print(f"Error saving the generated exam: {e}")
-
 async def main_test():
     """For standalone testing of the RAG service."""
     # Test generating a standard CAT exam
     cat_service = RAGService("CAT")
     await cat_service.generate_full_exam(exam_name="CAT")
+    await cat_service.close()
     
     # Test generating a GATE exam
     gate_service = RAGService("GATE")
     await gate_service.generate_full_exam(exam_name="GATE", stream="CS")
+    await gate_service.close()
 
 if __name__ == '__main__':
     asyncio.run(main_test())
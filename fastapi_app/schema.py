@@ -1,26 +1,40 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr
 from fastapi.security import OAuth2PasswordRequestForm as FastAPIForm
+from dataclasses import dataclass
 from datetime import datetime
 import enum
+from . import models
 
 # Define an Enum for user roles to match the database model
 class UserRole(str, enum.Enum):
     USER = "user"
     ADMIN = "admin"
 
+# Shared by the response models, which are read from ORM rows and never modified.
+# Frozen instances passed back into a model are reused as-is instead of revalidated or copied.
+RESPONSE_MODEL_CONFIG = ConfigDict(from_attributes=True, frozen=True, revalidate_instances="never")
+
 # --- User Schemas ---
 
-class UserBase(BaseModel):
-    """Base schema for a user, containing common attributes."""
+class UserBaseIn(BaseModel):
+    """Base schema for user input; the email address is validated here."""
     email: EmailStr
     full_name: str | None = None
 
-class UserCreate(UserBase):
-    """Schema used for creating a new user. Inherits from UserBase and adds a password."""
+class UserBaseOut(BaseModel):
+    """
+    Base schema for user data read back from the database. The email was validated
+    when the account was created, so it isn't run through the email validator again.
+    """
+    email: str
+    full_name: str | None = None
+
+class UserCreate(UserBaseIn):
+    """Schema used for creating a new user. Inherits from UserBaseIn and adds a password."""
     full_name: str
     password: str
 
-class User(UserBase):
+class User(UserBaseOut):
     """
     Schema used for returning user data from the API.
     It includes the ID, active status, and role, but crucially,
@@ -30,9 +44,8 @@ class User(UserBase):
     is_active: bool
     role: UserRole
 
-    class Config:
-        # This setting allows Pydantic to read data directly from ORM models.
-        from_attributes = True
+    # This setting allows Pydantic to read data directly from ORM models.
+    model_config = RESPONSE_MODEL_CONFIG
 
 # --- Token Schemas ---
 
@@ -42,28 +55,34 @@ class Token(BaseModel):
     token_type: str
     user_name: str | None = None
 
-class TokenData(BaseModel):
-    """Schema for the data contained within a JWT token."""
+@dataclass(slots=True)
+class TokenData:
+    """
+    The data contained within a JWT token. Only built from verified token payloads
+    inside security.get_current_user, so it is a plain dataclass without validation.
+    """
     email: str | None = None
     user_id: int | None = None
-    role: str | None = None
+    role: models.UserRole | None = None # Resolved from the role claim by security._ROLE_MAP
     name: str | None = None
 
 # --- Exam Submission Schemas ---
 
-class GeneratedExamResponse(BaseModel):
-    """Response for a generated exam that hasn't been attempted yet."""
+class GeneratedExamSummary(BaseModel):
+    """List view of a generated exam; omits the (large) exam_data payload."""
     id: int
     exam_type: str
     exam_name: str
     stream: str | None
     year: int | None
     generated_at: datetime
-    exam_data: dict
     is_attempted: bool
 
-    class Config:
-        from_attributes = True
+    model_config = RESPONSE_MODEL_CONFIG
+
+class GeneratedExamResponse(GeneratedExamSummary):
+    """Response for a generated exam that hasn't been attempted yet."""
+    exam_data: dict
 
 class ExamSubmissionRequest(BaseModel):
     generated_exam_id: int | None = None
@@ -80,7 +99,8 @@ class ExamSubmissionRequest(BaseModel):
     time_taken: int | None = None
     exam_data: dict
 
-class ExamAttemptResponse(BaseModel):
+class ExamAttemptSummary(BaseModel):
+    """List view of an exam attempt; omits the (large) exam_data payload."""
     id: int
     exam_type: str
     exam_name: str
@@ -94,10 +114,11 @@ class ExamAttemptResponse(BaseModel):
     percentage: int | None
     time_taken: int | None
     submitted_at: datetime | None
-    exam_data: dict
 
-    class Config:
-        from_attributes = True
+    model_config = RESPONSE_MODEL_CONFIG
+
+class ExamAttemptResponse(ExamAttemptSummary):
+    exam_data: dict
 
 # --- Exam Generation Schemas ---
 class ExamGenerationRequest(BaseModel):
@@ -111,14 +132,16 @@ class ExamGenerationRequest(BaseModel):
     stream: str | None = None  # Required for GATE exams (CS, EE, ME, etc.)
     year: int | None = None
     
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
-                "exam_name": "GATE",
+                "exam_type": "GATE",
+                "exam_name": "cs_exam_2024",
                 "stream": "CS",
                 "year": 2024
             }
         }
+    )
 
 
 # --- OAuth2 Password Request Form ---
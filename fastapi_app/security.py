@@ -1,73 +1,202 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import AsyncSession
+from jose import JWTError, jwk, jws, jwt
+import orjson
+import bcrypt
+from cachetools import TTLCache
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from typing import Final
+import asyncio
+import hashlib
+import threading
+import time
+import os
 
-from . import schema, database, models, crud, config
+from . import schema, database, models, crud, config, cache_invalidation
 
 # --- Password Hashing ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# New hashes use argon2id; bcrypt is only kept to verify legacy hashes,
+# which are upgraded to argon2id on the next successful login.
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19 * 1024, parallelism=1)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Enum members are singletons, so role checks can use identity comparison
+_ADMIN_ROLE: Final = models.UserRole.ADMIN
+# Token role claim -> UserRole member, resolved with one dict lookup per request
+_ROLE_MAP: Final = {role.value: role for role in models.UserRole}
+
+# Dedicated pool for password hashing so a slow verify never ties up
+# the event loop or FastAPI's shared threadpool.
+HASH_POOL = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="password-hash")
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verifies a plain-text password against a hashed password."""
-    return pwd_context.verify(plain_password, hashed_password)
+    """Verifies a plain-text password against an argon2id or legacy bcrypt hash."""
+    if hashed_password.startswith("$argon2"):
+        try:
+            return password_hasher.verify(hashed_password, plain_password)
+        except (VerificationError, InvalidHashError):
+            return False
+    try:
+        return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+    except ValueError:
+        # Not a bcrypt hash either
+        return False
 
 def get_password_hash(password: str) -> str:
-    """Hashes a plain-text password using bcrypt."""
-    return pwd_context.hash(password)
+    """Hashes a plain-text password using argon2id."""
+    return password_hasher.hash(password)
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Returns True for legacy bcrypt hashes or argon2 hashes with outdated parameters."""
+    if not hashed_password.startswith("$argon2"):
+        return True
+    return password_hasher.check_needs_rehash(hashed_password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Runs verify_password on HASH_POOL."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(HASH_POOL, verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Runs get_password_hash on HASH_POOL."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(HASH_POOL, get_password_hash, password)
 
 # --- JWT Token Functions ---
 
+# Built once so python-jose doesn't re-construct the HMAC key (and first try to
+# parse SECRET_KEY as a JWK JSON document) on every encode and decode.
+_JWT_KEY = jwk.construct(config.settings.SECRET_KEY, config.settings.ALGORITHM)
+_DEFAULT_TOKEN_TTL = timedelta(minutes=config.settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     """Creates a new JWT access token."""
     to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
-    else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=config.settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    expire = datetime.now(timezone.utc) + (expires_delta or _DEFAULT_TOKEN_TTL)
     
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, config.settings.SECRET_KEY, algorithm=config.settings.ALGORITHM)
+    # jwt.encode would convert exp to a NumericDate itself and serialize the claims
+    # with stdlib json; jws.sign takes the already-serialized claims as bytes instead.
+    to_encode.update({"exp": int(expire.timestamp())})
+    encoded_jwt = jws.sign(orjson.dumps(to_encode), _JWT_KEY, algorithm=config.settings.ALGORITHM)
     return encoded_jwt
 
+# Verified token payloads, keyed by the raw token. The short TTL bounds how long a
+# payload is reused; expiry is still checked against the clock on every request.
+_token_cache = TTLCache(maxsize=4096, ttl=5)
+_token_cache_lock = threading.Lock()
+
+def _decode_token(token: str) -> dict:
+    """Verifies and decodes a JWT, reusing the payload of recently seen tokens."""
+    with _token_cache_lock:
+        payload = _token_cache.get(token)
+    if payload is None:
+        # Raises JWTError for invalid tokens, which are never cached
+        payload = jwt.decode(token, _JWT_KEY, algorithms=[config.settings.ALGORITHM])
+        with _token_cache_lock:
+            _token_cache[token] = payload
+    elif payload.get("exp") is not None and payload["exp"] <= time.time():
+        raise JWTError("Signature has expired.")
+    return payload
+
+# Resolved users keyed by token digest, so repeat requests with the same token skip the
+# user lookup entirely. Entries are evicted on every worker when the user row changes
+# (see cache_invalidation), so the longer TTL doesn't delay role changes or deactivation.
+_token_user_cache = TTLCache(maxsize=2048, ttl=60)
+
+@cache_invalidation.on_invalidate
+def _evict_token_users(user_id: int | None):
+    with _token_cache_lock:
+        if user_id is None:
+            _token_user_cache.clear()
+            return
+        for digest in [digest for digest, user in _token_user_cache.items() if user.id == user_id]:
+            _token_user_cache.pop(digest, None)
+
+def _token_digest(token: str) -> str:
+    return hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+
+def clear_token_cache():
+    """Drops all cached token payloads and users, e.g. after a logout."""
+    with _token_cache_lock:
+        _token_cache.clear()
+        _token_user_cache.clear()
+
 # --- FastAPI Dependencies for Security ---
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
-    """
-    FastAPI dependency to get the current user from a JWT token.
-    The token payload now includes the user's role.
-    """
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _token_claims(token: str) -> schema.TokenData:
+    """Verifies a token and returns its claims; raises a 401 for invalid tokens."""
     try:
-        payload = jwt.decode(token, config.settings.SECRET_KEY, algorithms=[config.settings.ALGORITHM])
+        payload = _decode_token(token)
         email: str = payload.get("sub")
         user_id: int = payload.get("user_id")
-        role: str = payload.get("role") # Get role from token
+        role_claim = payload.get("role")
+        # Get role from token; unknown or non-string (unhashable) role claims are rejected
+        role = _ROLE_MAP.get(role_claim) if isinstance(role_claim, str) else None
         name: str | None = payload.get("name")
         if email is None or user_id is None or role is None:
-            raise credentials_exception
-        token_data = schema.TokenData(email=email, user_id=user_id, role=role, name=name)
+            raise _credentials_exception()
+        return schema.TokenData(email=email, user_id=user_id, role=role, name=name)
     except JWTError:
-        raise credentials_exception
-    
-    user = crud.get_user_by_email(db, email=token_data.email)
-    if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+
+def _cached_token_user(digest: str) -> "crud.CachedUser | None":
+    with _token_cache_lock:
+        return _token_user_cache.get(digest)
+
+def _remember_token_user(digest: str, generation: int, token_data: schema.TokenData, user: "crud.CachedUser | None") -> "crud.CachedUser":
+    if user is None or user.id != token_data.user_id:
+        raise _credentials_exception()
+    # Skip caching a user loaded before an invalidation that arrived during the lookup
+    if cache_invalidation.generation() == generation:
+        with _token_cache_lock:
+            _token_user_cache[digest] = user
     return user
 
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+    """
+    FastAPI dependency to get the current user from a JWT token.
+    The token payload now includes the user's role.
+    """
+    token_data = _token_claims(token)
+    digest = _token_digest(token)
+    cached_user = _cached_token_user(digest)
+    if cached_user is not None:
+        return cached_user
+
+    generation = cache_invalidation.generation()
+    user = crud.get_user_by_email(db, email=token_data.email)
+    return _remember_token_user(digest, generation, token_data, user)
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)):
+    """get_current_user for the async endpoints, so resolving the user doesn't need a worker thread."""
+    token_data = _token_claims(token)
+    digest = _token_digest(token)
+    cached_user = _cached_token_user(digest)
+    if cached_user is not None:
+        return cached_user
+
+    generation = cache_invalidation.generation()
+    user = await crud.get_user_by_email_async(db, email=token_data.email)
+    return _remember_token_user(digest, generation, token_data, user)
+
 def get_current_admin_user(current_user: models.User = Depends(get_current_user)):
     """
     A new dependency that checks if the current user has the 'admin' role.
     This will be used to protect admin-only endpoints.
     """
-    if current_user.role != models.UserRole.ADMIN:
+    if current_user.role is not _ADMIN_ROLE:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="The user does not have sufficient privileges for this operation.",
@@ -79,6 +208,7 @@ def get_current_active_subscriber(current_user: models.User = Depends(get_curren
     if not current_user.is_active:
          raise HTTPException(status_code=400, detail="Inactive user")
 
+    # Usually a cache hit: crud.get_user_by_email primes it when loading the user
     subscription = crud.get_subscription_by_user_id(db, user_id=current_user.id)
     
     if not subscription or not subscription.is_active:
@@ -87,7 +217,7 @@ def get_current_active_subscriber(current_user: models.User = Depends(get_curren
             detail="User does not have an active subscription.",
         )
         
-    if subscription.expires_at and subscription.expires_at < datetime.now():
+    if subscription.expires_at and subscription.expires_at < datetime.now(timezone.utc):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Subscription has expired.",
@@ -1,64 +1,91 @@
-# Import the necessary components from your application
+# The application modules are imported inside the functions below, so that running
+# this script can warm the slow imports in parallel before it touches the database.
 # Using absolute imports to be runnable from the project root
-from fastapi_app.database import engine, SessionLocal, Base
-from fastapi_app import crud, models, schema
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+import logging
 
-print("Connecting to the database to create tables...")
+logger = logging.getLogger("seed_db")
 
-try:
-    # This command inspects all the classes that inherit from Base (your User and Subscription models)
-    # and creates the corresponding tables in the database if they don't already exist.
-    Base.metadata.create_all(bind=engine)
-    print("Tables created successfully or already exist.")
-except Exception as e:
-    print(f"An error occurred while creating tables: {e}")
-    # Exit if we can't even create tables
-    exit()
+# Imported on background threads while the main thread loads the app's database module
+PREFETCH_MODULES = ["argon2", "sqlalchemy.dialects.postgresql", "fastapi_app.models"]
+
+# Demo accounts: (label, email, full name, password, role)
+DEMO_USERS = [
+    ("Standard user", "user@example.com", "Demo User", "password", "user"),
+    ("Admin user", "admin@example.com", "Demo Admin", "adminpassword", "admin"),
+]
+
+def create_tables():
+    """Creates any missing tables. Returns False if the database can't be reached."""
+    from fastapi_app.database import engine, Base
+    from fastapi_app import models  # noqa: F401 - registers the tables on Base
+
+    logger.info("Connecting to the database to create tables...")
+    try:
+        # This command inspects all the classes that inherit from Base (your User and Subscription models)
+        # and creates the corresponding tables in the database if they don't already exist.
+        Base.metadata.create_all(bind=engine)
+        logger.info("Tables created successfully or already exist.")
+        return True
+    except Exception as e:
+        logger.error(f"An error occurred while creating tables: {e}")
+        return False
 
 def seed_database():
     """
     Populates the database with initial demo data, such as a default user and admin.
     This function is idempotent, meaning it can be run multiple times without creating duplicates.
     """
-    db = SessionLocal()
-    print("\nSeeding database with demo users...")
-    try:
-        # --- Check for and create the standard user ---
-        user_exists = crud.get_user_by_email(db, "user@example.com")
-        if not user_exists:
-            print("Creating standard user...")
-            user_in = schema.UserCreate(
-                email="user@example.com",
-                full_name="Demo User",
-                password="password"
-            )
-            crud.create_user(db=db, user=user_in, role=models.UserRole.USER)
-            print("- Standard user created: user@example.com")
-        else:
-            print("- Standard user already exists.")
+    from argon2 import PasswordHasher
+    from sqlalchemy.dialects.postgresql import insert
+    from fastapi_app.database import SessionLocal
+    from fastapi_app import models
 
-        # --- Check for and create the admin user ---
-        admin_exists = crud.get_user_by_email(db, "admin@example.com")
-        if not admin_exists:
-            print("Creating admin user...")
-            admin_in = schema.UserCreate(
-                email="admin@example.com",
-                full_name="Demo Admin",
-                password="adminpassword"
-            )
-            crud.create_user(db=db, user=admin_in, role=models.UserRole.ADMIN)
-            print("- Admin user created: admin@example.com")
+    # Seed passwords don't need production-strength hashing. security.password_needs_rehash
+    # flags these parameters, so the hashes are upgraded on the account's first login.
+    seed_password_hasher = PasswordHasher(time_cost=1, memory_cost=8 * 1024, parallelism=1)
+
+    logger.info("\nSeeding database with demo users...")
+
+    # argon2 releases the GIL while hashing, so the passwords are hashed concurrently
+    with ThreadPoolExecutor(max_workers=len(DEMO_USERS)) as executor:
+        hashed_passwords = list(executor.map(seed_password_hasher.hash, [demo_user[3] for demo_user in DEMO_USERS]))
+
+    rows = [
+        {"email": email, "full_name": full_name, "hashed_password": hashed_password, "role": models.UserRole(role)}
+        for (_, email, full_name, _, role), hashed_password in zip(DEMO_USERS, hashed_passwords)
+    ]
+    # One INSERT for all demo users in one transaction; existing accounts are left untouched
+    statement = (
+        insert(models.User)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=[models.User.email])
+        .returning(models.User.email)
+    )
+    with SessionLocal() as db:
+        created = set(db.scalars(statement).all())
+        db.commit()
+
+    for label, email, *_ in DEMO_USERS:
+        if email in created:
+            logger.info(f"- {label} created: {email}")
         else:
-            print("- Admin user already exists.")
-            
-        print("\n-------------------------------------------")
-        print("Database seeding complete.")
-        print("You can now start the main application.")
-        print("-------------------------------------------")
+            logger.info(f"- {label} already exists.")
 
-    finally:
-        db.close()
+    logger.info("\n-------------------------------------------")
+    logger.info("Database seeding complete.")
+    logger.info("You can now start the main application.")
+    logger.info("-------------------------------------------")
 
 if __name__ == "__main__":
-    seed_database()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    with ThreadPoolExecutor(max_workers=len(PREFETCH_MODULES)) as prefetch:
+        for module_name in PREFETCH_MODULES:
+            prefetch.submit(importlib.import_module, module_name)
+        importlib.import_module("fastapi_app.database")
 
+    # Exit if we can't even create tables
+    if create_tables():
+        seed_database()
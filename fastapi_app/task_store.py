@@ -0,0 +1,69 @@
+import json
+import redis.asyncio as redis
+from cachetools import TTLCache
+
+# How long a task's status/result is kept after its last update
+TASK_TTL_SECONDS = 3600
+# Upper bound on tasks held by the in-memory store
+MAX_IN_MEMORY_TASKS = 10_000
+
+class InMemoryTaskStore:
+    """
+    Keeps task state in a process-local, size- and TTL-bounded cache.
+    Only suitable for local development with a single uvicorn worker.
+    """
+    def __init__(self):
+        # All access happens on the event loop without awaiting in between,
+        # so no lock is needed around the (non thread-safe) TTLCache.
+        self._tasks = TTLCache(maxsize=MAX_IN_MEMORY_TASKS, ttl=TASK_TTL_SECONDS)
+        self.hits = 0
+        self.misses = 0
+
+    async def set(self, task_id: str, data: dict):
+        self._tasks[task_id] = data
+
+    async def get(self, task_id: str) -> dict | None:
+        task = self._tasks.get(task_id)
+        if task is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return task
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "size": len(self._tasks), "hits": self.hits, "misses": self.misses}
+
+class RedisTaskStore:
+    """
+    Keeps task state in Redis so every API worker sees the same tasks.
+    Entries expire after TASK_TTL_SECONDS.
+    """
+    def __init__(self, url: str):
+        self._redis = redis.from_url(url)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(task_id: str) -> str:
+        return f"exam_task:{task_id}"
+
+    async def set(self, task_id: str, data: dict):
+        await self._redis.set(self._key(task_id), json.dumps(data), ex=TASK_TTL_SECONDS)
+
+    async def get(self, task_id: str) -> dict | None:
+        raw = await self._redis.get(self._key(task_id))
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses}
+
+def create_task_store(redis_url: str | None):
+    """Returns a Redis-backed store when a URL is configured, otherwise an in-memory one."""
+    if redis_url:
+        return RedisTaskStore(redis_url)
+    print("Warning: REDIS_URL not set. Exam task status is kept in memory and is not shared between workers.")
+    return InMemoryTaskStore()
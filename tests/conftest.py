@@ -0,0 +1,39 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+
+from fastapi_app import crud, models, security
+
+# The models use PostgreSQL's JSONB; SQLite stores the same documents as JSON
+@compiles(JSONB, "sqlite")
+def _compile_jsonb_sqlite(type_, compiler, **kw):
+    return "JSON"
+
+@pytest.fixture
+def db():
+    """A session on a fresh in-memory SQLite database with every model table."""
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine, autoflush=False)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+@pytest.fixture
+def user(db):
+    db_user = models.User(email="student@example.com", hashed_password=security.get_password_hash("password"))
+    db.add(db_user)
+    db.commit()
+    return db_user
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """The user, subscription and token caches are process-wide, so start every test empty."""
+    crud._user_cache.clear()
+    crud._subscription_cache.clear()
+    security.clear_token_cache()
+    yield
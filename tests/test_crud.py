@@ -0,0 +1,93 @@
+import pytest
+
+from fastapi_app import cache_invalidation, crud
+
+COMPLETE_CAT_EXAM = {"VARC": [{"question": "q1"}], "DILR": [{"question": "q2"}], "QA": [{"question": "q3"}], "errors": []}
+
+@pytest.mark.parametrize("exam_data, expected", [
+    (COMPLETE_CAT_EXAM, True),
+    ({"GA": [{"question": "q1"}], "TECH": [{"question": "q2"}]}, True),
+    ({"error": "Unsupported exam type"}, False),
+    ({"GA": [{"question": "q1"}], "TECH": [{"question": "q2"}], "errors": [{"error": "timeout"}]}, False),
+    # A failed LLM call leaves every section empty and every question under "errors"
+    ({"VARC": [], "DILR": [], "QA": [], "errors": [{"error": "connection refused"}]}, False),
+    ({"VARC": [{"question": "q1"}], "DILR": [], "QA": [{"question": "q3"}], "errors": []}, False),
+    ({"errors": []}, False),
+    ({}, False),
+])
+def test_is_complete_exam(exam_data, expected):
+    assert crud.is_complete_exam(exam_data) is expected
+
+def test_create_generated_exam_flags_incomplete_exams(db, user):
+    complete = crud.create_generated_exam(db, user, "CAT", "CAT Mock", None, 2024, COMPLETE_CAT_EXAM)
+    failed = crud.create_generated_exam(db, user, "CAT", "CAT Mock", None, 2024, {"error": "LLM unavailable"})
+
+    assert complete.is_complete is True
+    # Incomplete exams are still stored for the user who generated them
+    assert failed.is_complete is False
+    assert failed.user_id == user.id
+
+def test_get_cached_exam_data_matches_type_stream_and_year(db, user):
+    gate_exam = {"GA": [{"question": "q1"}], "TECH": [{"question": "q2"}], "errors": []}
+    crud.create_generated_exam(db, user, "GATE", "GATE CS Mock", "CS", 2024, gate_exam)
+    crud.create_generated_exam(db, user, "CAT", "CAT Mock", None, 2023, COMPLETE_CAT_EXAM)
+
+    assert crud.get_cached_exam_data(db, "gate", "cs", 2024) == gate_exam
+    assert crud.get_cached_exam_data(db, "CAT", None, 2023) == COMPLETE_CAT_EXAM
+    assert crud.get_cached_exam_data(db, "GATE", "EE", 2024) is None
+    assert crud.get_cached_exam_data(db, "GATE", "CS", 2023) is None
+    assert crud.get_cached_exam_data(db, "CAT", "CS", 2023) is None
+
+def test_get_cached_exam_data_skips_incomplete_exams(db, user):
+    crud.create_generated_exam(db, user, "CAT", "CAT Mock", None, 2022, {"error": "LLM unavailable"})
+    crud.create_generated_exam(
+        db, user, "CAT", "CAT Mock", None, 2022,
+        {"VARC": [], "DILR": [], "QA": [], "errors": [{"error": "connection refused"}]},
+    )
+    assert crud.get_cached_exam_data(db, "CAT", None, 2022) is None
+
+    crud.create_generated_exam(db, user, "CAT", "CAT Mock", None, 2022, COMPLETE_CAT_EXAM)
+    assert crud.get_cached_exam_data(db, "CAT", None, 2022) == COMPLETE_CAT_EXAM
+
+def test_invalidate_evicts_cached_user_and_subscription(db, user):
+    crud.get_user_by_email(db, user.email)
+    crud.get_subscription_by_user_id(db, user.id)
+    assert user.email in crud._user_cache
+    assert user.id in crud._subscription_cache
+
+    cache_invalidation.invalidate(user.id)
+
+    assert user.email not in crud._user_cache
+    assert user.id not in crud._subscription_cache
+
+def test_invalidate_of_another_user_keeps_cached_user(db, user):
+    crud.get_user_by_email(db, user.email)
+
+    cache_invalidation.invalidate(user.id + 1)
+
+    assert user.email in crud._user_cache
+
+def test_user_loaded_during_invalidation_is_not_cached(db, user, monkeypatch):
+    user_id, email = user.id, user.email
+    execute = db.execute
+
+    def execute_then_invalidate(*args, **kwargs):
+        # The row is read, then a change to it is announced before the result is cached
+        result = execute(*args, **kwargs)
+        cache_invalidation.invalidate(user_id)
+        return result
+
+    monkeypatch.setattr(db, "execute", execute_then_invalidate)
+    cached = crud.get_user_by_email(db, email)
+
+    assert cached.id == user_id
+    assert email not in crud._user_cache
+    assert user_id not in crud._subscription_cache
+
+def test_subscription_update_replaces_cached_negative_result(db, user):
+    assert crud.get_subscription_by_user_id(db, user.id) is None
+
+    crud.create_or_update_subscription(db, user.id, "cust_1", True, None)
+
+    subscription = crud.get_subscription_by_user_id(db, user.id)
+    assert subscription == crud.CachedSubscription(is_active=True, expires_at=None, payment_customer_id="cust_1")
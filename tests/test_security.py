@@ -0,0 +1,115 @@
+import time
+from datetime import timedelta
+
+import bcrypt
+import pytest
+from fastapi import HTTPException
+from jose import JWTError
+from sqlalchemy import event
+
+from fastapi_app import cache_invalidation, security
+
+def _token(role="user", expires_delta=None):
+    return security.create_access_token(
+        {"sub": "student@example.com", "user_id": 1, "role": role, "name": None}, expires_delta
+    )
+
+# --- Passwords ---
+
+def test_argon2_hash_round_trip():
+    hashed = security.get_password_hash("password")
+
+    assert hashed.startswith("$argon2id")
+    assert security.verify_password("password", hashed)
+    assert not security.verify_password("wrong", hashed)
+    assert not security.password_needs_rehash(hashed)
+
+def test_legacy_bcrypt_hash_verifies_and_needs_rehash():
+    hashed = bcrypt.hashpw(b"password", bcrypt.gensalt(rounds=4)).decode()
+
+    assert security.verify_password("password", hashed)
+    assert not security.verify_password("wrong", hashed)
+    assert security.password_needs_rehash(hashed)
+
+@pytest.mark.parametrize("hashed", ["", "not-a-hash", "$argon2id$v=19$broken"])
+def test_verify_password_rejects_malformed_hashes(hashed):
+    assert not security.verify_password("password", hashed)
+
+# --- Tokens ---
+
+def test_decode_token_reuses_cached_payload():
+    token = _token()
+
+    assert security._decode_token(token) is security._decode_token(token)
+
+def test_decode_token_rejects_expired_cached_token(monkeypatch):
+    token = _token(expires_delta=timedelta(seconds=60))
+    payload = security._decode_token(token)
+    assert token in security._token_cache
+
+    # Still within the cache TTL, but past the token's own expiry
+    monkeypatch.setattr(security.time, "time", lambda: payload["exp"] + 1)
+    with pytest.raises(JWTError):
+        security._decode_token(token)
+
+def test_decode_token_rejects_tampered_token():
+    token = _token()
+    with pytest.raises(JWTError):
+        security._decode_token(token[:-2] + ("AA" if not token.endswith("AA") else "BB"))
+    assert len(security._token_cache) == 0
+
+@pytest.mark.parametrize("role", ["user", "admin"])
+def test_token_claims_resolve_role(role):
+    assert security._token_claims(_token(role)).role is security._ROLE_MAP[role]
+
+@pytest.mark.parametrize("role", ["superuser", ["admin"], {"role": "admin"}, 1, None])
+def test_token_claims_reject_invalid_roles(role):
+    with pytest.raises(HTTPException) as exc_info:
+        security._token_claims(_token(role))
+    assert exc_info.value.status_code == 401
+
+# --- Current user ---
+
+def test_get_current_user_serves_repeat_requests_from_cache(db, user):
+    token = security.create_access_token(
+        {"sub": user.email, "user_id": user.id, "role": user.role.value, "name": None}
+    )
+    first = security.get_current_user(token, db)
+
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert security.get_current_user(token, db) is first
+    assert statements == []
+
+def test_invalidate_evicts_cached_token_user(db, user):
+    token = security.create_access_token(
+        {"sub": user.email, "user_id": user.id, "role": user.role.value, "name": None}
+    )
+    security.get_current_user(token, db)
+    assert len(security._token_user_cache) == 1
+
+    cache_invalidation.invalidate(user.id)
+
+    assert len(security._token_user_cache) == 0
+
+def test_get_current_user_rejects_token_for_another_user(db, user):
+    token = security.create_access_token(
+        {"sub": user.email, "user_id": user.id + 1, "role": user.role.value, "name": None}
+    )
+    with pytest.raises(HTTPException) as exc_info:
+        security.get_current_user(token, db)
+    assert exc_info.value.status_code == 401
+    assert len(security._token_user_cache) == 0
+
+def test_expired_token_is_rejected_by_get_current_user(db, user, monkeypatch):
+    token = security.create_access_token(
+        {"sub": user.email, "user_id": user.id, "role": user.role.value, "name": None},
+        timedelta(seconds=60),
+    )
+    security.get_current_user(token, db)
+
+    expired_at = time.time() + 120
+    monkeypatch.setattr(security.time, "time", lambda: expired_at)
+    with pytest.raises(HTTPException) as exc_info:
+        security.get_current_user(token, db)
+    assert exc_info.value.status_code == 401